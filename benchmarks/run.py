@@ -0,0 +1,317 @@
+"""Бенчмарки основных операций плеера на синтетических медиатеках разного размера.
+
+Запуск из корня репозитория:
+
+    python benchmarks/run.py --sizes 1000,10000,100000
+
+Для каждого размера генерируется (или переиспользуется) медиатека и замеряются:
+первое сканирование и повторное без изменений, чтение тегов, построение строк
+главного списка из индекса, память на трек в загруженной медиатеке, порядки
+сортировки и переключение видов, извлечение обложек, переходы по очереди, поиск,
+запись и загрузка плейлистов. Всё работает без Kivy; строки списка строятся так
+же, как в TrackListView.make_row, но без виджетов. Результаты одного запуска
+дописываются в --output одной JSON-строкой, а --compare печатает отношение
+времени к предыдущему запуску из того же файла.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import subprocess
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import generate
+from library import LibraryIndex, ScanOptions
+from formats import read_tags, is_audio_name
+from covers import extract_cover_art
+from playqueue import PlayQueue
+from playlists import PlaylistStore
+from search import SearchIndex
+from views import SORT_ORDERS
+
+DEFAULT_SIZES = (1000, 10000)
+WORK_DIR = os.path.join(ROOT, 'benchmarks', 'work')
+OUTPUT_PATH = os.path.join(ROOT, 'benchmarks', 'results.jsonl')
+TAG_SAMPLE = 2000
+COVER_SAMPLE = 200
+PLAYLISTS = 10
+QUERIES = ('n', 'ni', 'nig', 'night', 'ночь', 'ri st', 'сер', 'zzz')
+
+
+class Bench:
+    """Копит результаты замеров одного запуска"""
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def measure(self, size, name, items, fn, repeat=None):
+        """Выполняет fn repeat раз и записывает лучшее время; items — сколько единиц работы в одном вызове"""
+        best = None
+        for _ in range(repeat or self.repeat):
+            started = time.perf_counter()
+            fn()
+            took = time.perf_counter() - started
+            best = took if best is None else min(best, took)
+        self.record(size, name, items, best)
+
+    def memory(self, size, name, fn, rss=None):
+        """Замеряет память, которую держит результат fn(); fn возвращает (результат, число треков).
+
+        bytes — выделенное Python по tracemalloc; rss — прирост резидентной памяти,
+        если его удалось замерить отдельно (см. rss_probe).
+        """
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result, items = fn()
+            gc.collect()
+            used = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del result
+        self.results.append({'size': size, 'op': name, 'items': items, 'bytes': used,
+                             'bytes_per_item': round(used / items, 1) if items else None,
+                             'rss_bytes': rss})
+        print(f'{size:>7} {name:<20} {used / 2 ** 20:10.1f} МБ'
+              + (f'  {used / items:8.0f} байт/шт' if items else '')
+              + (f'  (RSS +{rss / 2 ** 20:.1f} МБ)' if rss is not None else ''))
+
+    def record(self, size, name, items, seconds):
+        per_item = seconds / items * 1e6 if items else None
+        self.results.append({'size': size, 'op': name, 'items': items, 'seconds': round(seconds, 6),
+                             'per_item_us': round(per_item, 3) if per_item is not None else None})
+        print(f'{size:>7} {name:<20} {seconds * 1000:10.1f} мс'
+              + (f'  {per_item:8.1f} мкс/шт' if per_item is not None else ''))
+
+
+def _rss():
+    """Резидентная память процесса в байтах или None, если /proc недоступен"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _load_library(db_path):
+    """Медиатека в памяти, как её держит приложение: таблица метаданных и список путей"""
+    index = LibraryIndex(db_path)
+    index.load_metadata()
+    loaded = (index, index.paths())
+    index.close()
+    return loaded, len(loaded[1])
+
+
+def rss_probe(db_path):
+    """Прирост резидентной памяти от загрузки медиатеки в чистом процессе.
+
+    В основном процессе аллокатор уже держит память от прошлых замеров, так
+    что RSS меряется в отдельном запуске этого же скрипта.
+    """
+    try:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--rss-probe', db_path],
+                                capture_output=True, text=True, timeout=600).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    except (OSError, subprocess.SubprocessError, ValueError, IndexError):
+        return None
+
+
+def _rss_probe_main(db_path):
+    gc.collect()
+    before = _rss()
+    loaded = _load_library(db_path)
+    gc.collect()
+    print(json.dumps(_rss() - before if before is not None else None))
+    return loaded
+
+
+def _remove_db(path):
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _audio_files(root):
+    result = []
+    for dir_path, _, names in os.walk(root):
+        result.extend(os.path.join(dir_path, name).replace('\\', '/') for name in names if is_audio_name(name))
+    result.sort()
+    return result
+
+
+def bench_size(bench, size, work_dir):
+    lib_root = os.path.join(work_dir, f'lib{size}')
+    started = time.perf_counter()
+    manifest = generate(lib_root, size)
+    print(f'{size:>7} медиатека готова за {time.perf_counter() - started:.1f} с: {manifest}')
+    options = ScanOptions([lib_root])
+    db_path = os.path.join(work_dir, f'index{size}.db')
+    _remove_db(db_path)
+
+    library = LibraryIndex(db_path)
+    started = time.perf_counter()
+    library.rescan(options)
+    bench.record(size, 'scan_first', size, time.perf_counter() - started)
+    bench.measure(size, 'scan_incremental', size, lambda: library.rescan(options))
+    library.close()
+
+    files = _audio_files(lib_root)
+    sample = random.Random(0).sample(files, min(TAG_SAMPLE, len(files)))
+
+    def read_sample():
+        for path in sample:
+            try:
+                read_tags(path)
+            except Exception:
+                pass
+
+    bench.measure(size, 'tags', len(sample), read_sample)
+
+    # Как при запуске приложения: кэш метаданных из индекса одним запросом, затем строки списка
+    def build_list():
+        index = LibraryIndex(db_path)
+        index.load_metadata()
+        paths = index.paths()
+        rows = []
+        for path in paths:
+            rows.append({'path': path, 'text': index.display_name(path) or os.path.basename(path)})
+        index.close()
+        return rows
+
+    rows = build_list()
+    paths = [row['path'] for row in rows]
+    bench.measure(size, 'list_build', len(rows), build_list)
+
+    bench.memory(size, 'library_memory', lambda: _load_library(db_path), rss=rss_probe(db_path))
+
+    library = LibraryIndex(db_path)
+    library.load_metadata()
+    with_covers = sorted(library.select('has_cover', bool))[:COVER_SAMPLE]
+
+    def build_views():
+        library.views.invalidate()
+        library.prepare_views()
+
+    bench.measure(size, 'views_build', len(paths), build_views)
+    bench.measure(size, 'view_switch', len(SORT_ORDERS) + 1,
+                  lambda: [library.sorted_paths(order) for order in SORT_ORDERS] + [library.artists()])
+    cover_path = os.path.join(work_dir, 'cover.jpg')
+    bench.measure(size, 'cover_extract', len(with_covers),
+                  lambda: [extract_cover_art(path, cover_path) for path in with_covers])
+
+    def navigate():
+        queue = PlayQueue(paths, 0)
+        for _ in range(len(paths)):
+            queue.next()
+        for _ in range(len(paths)):
+            queue.prev()
+        queue.set_shuffle(True)
+        for _ in range(len(paths)):
+            queue.next()
+
+    bench.measure(size, 'queue_next_prev', len(paths) * 3, navigate)
+
+    search = SearchIndex()
+    bench.measure(size, 'search_build', len(paths), lambda: [
+        search.add(path, meta.title, meta.artist, meta.album)
+        for path, meta in ((path, library.metadata(path)) for path in paths)], repeat=1)
+
+    def run_queries():
+        for query in QUERIES:
+            # Каждый запрос как первый после изменения индекса — без готовых префиксов
+            search.prefix_cache.clear()
+            search.search(query)
+
+    bench.measure(size, 'search_query', len(QUERIES), run_queries)
+
+    ids = list(library.track_ids(paths).values())
+    playlists_path = os.path.join(work_dir, f'playlists{size}.json')
+
+    def save_playlists():
+        for path in (playlists_path, playlists_path + '.journal'):
+            if os.path.exists(path):
+                os.remove(path)
+        store = PlaylistStore(playlists_path)
+        for number in range(PLAYLISTS):
+            store.create(f'Плейлист {number}')
+            store.set_tracks(f'Плейлист {number}', ids[number::PLAYLISTS])
+        store.flush()
+        store.compact()
+
+    def load_playlists():
+        PlaylistStore(playlists_path).load()
+
+    bench.measure(size, 'playlists_save', len(ids), save_playlists)
+    bench.measure(size, 'playlists_load', len(ids), load_playlists)
+    library.close()
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(previous, current):
+    """Печатает отношение времени (или памяти) текущего запуска к предыдущему по каждой операции"""
+    def value(result):
+        # Для замеров памяти сравниваются байты, для остальных — время
+        return result.get('bytes', result.get('seconds'))
+
+    before = {(result['size'], result['op']): value(result) for result in previous['results']}
+    print(f"Сравнение с {previous.get('version')} от {time.ctime(previous['time'])}:")
+    for result in current['results']:
+        old = before.get((result['size'], result['op']))
+        if old:
+            print(f"{result['size']:>7} {result['op']:<20} x{value(result) / old:6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарки медиатеки, очереди и плейлистов')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='размеры медиатек через запятую, например 1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=3, help='повторов каждого замера, берётся лучший')
+    parser.add_argument('--work', default=WORK_DIR, help='каталог для медиатек и индексов')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='файл JSON-строк с результатами')
+    parser.add_argument('--compare', action='store_true', help='сравнить с предыдущим запуском в --output')
+    parser.add_argument('--clean', action='store_true', help='удалить сгенерированные медиатеки после запуска')
+    parser.add_argument('--rss-probe', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.rss_probe:
+        _rss_probe_main(args.rss_probe)
+        return
+
+    os.makedirs(args.work, exist_ok=True)
+    bench = Bench(args.repeat)
+    for size in (int(size) for size in args.sizes.split(',')):
+        bench_size(bench, size, args.work)
+
+    run = {'time': time.time(), 'version': git_version(), 'python': platform.python_version(),
+           'platform': platform.platform(), 'cpus': os.cpu_count(), 'repeat': args.repeat,
+           'results': bench.results}
+    previous = None
+    if args.compare and os.path.exists(args.output):
+        with open(args.output, 'r', encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+        previous = json.loads(lines[-1]) if lines else None
+    with open(args.output, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(run, ensure_ascii=False) + '\n')
+    if previous is not None:
+        compare(previous, run)
+    if args.clean:
+        shutil.rmtree(args.work)
+
+
+if __name__ == '__main__':
+    main()
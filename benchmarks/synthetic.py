@@ -0,0 +1,146 @@
+"""Генератор синтетической медиатеки для бенчмарков.
+
+Треки раскладываются как настоящая медиатека: Исполнитель/Альбом (год)/NN - Название.mp3,
+плюс плоская папка загрузок. Теги ID3v2.4 собираются вручную, без mutagen, чтобы
+100 тысяч файлов генерировались за минуты. У части альбомов есть обложка APIC,
+небольшая доля файлов битая: обрезанный тег, мусор вместо MP3 или HTML-страница
+с расширением .mp3. Один и тот же seed всегда даёт одну и ту же медиатеку.
+"""
+import os
+import json
+import random
+import shutil
+
+GENERATOR_VERSION = 1
+MANIFEST = 'manifest.json'
+# Заголовок кадра MPEG-1 Layer III, 128 кбит/с, 44.1 кГц, и его полная длина
+FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+COVER_SHARE = 0.2
+CORRUPT_SHARE = 0.01
+LOOSE_SHARE = 0.05
+COVER_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'icon.jpg')
+
+SYLLABLES = ['ka', 'ri', 'mo', 'len', 'tor', 'vi', 'sa', 'ne', 'dro', 'mir', 'lu', 'gan']
+SYLLABLES_RU = ['ка', 'ри', 'мо', 'лен', 'тор', 'ви', 'са', 'не', 'дро', 'мир', 'лю', 'ёж']
+WORDS = ['Night', 'Light', 'River', 'Storm', 'Dream', 'Fire', 'Summer', 'Road', 'Heart', 'Echo',
+         'Ночь', 'Свет', 'Река', 'Гроза', 'Сон', 'Огонь', 'Лето', 'Дорога', 'Сердце', 'Эхо']
+GENRES = ['Rock', 'Pop', 'Jazz', 'Electronic', 'Hip-Hop', 'Classical', 'Metal', 'Folk']
+
+
+def _syncsafe(size):
+    return bytes(((size >> 21) & 0x7f, (size >> 14) & 0x7f, (size >> 7) & 0x7f, size & 0x7f))
+
+
+def _frame(frame_id, data):
+    return frame_id.encode('ascii') + _syncsafe(len(data)) + b'\x00\x00' + data
+
+
+def _text_frame(frame_id, text):
+    return _frame(frame_id, b'\x03' + text.encode('utf-8'))
+
+
+def id3_tag(title, artist, album, track, year, genre, cover=None):
+    """Собирает тег ID3v2.4 с текстовыми кадрами в UTF-8 и, если задана, обложкой"""
+    frames = [_text_frame('TIT2', title), _text_frame('TPE1', artist), _text_frame('TALB', album),
+              _text_frame('TRCK', str(track)), _text_frame('TDRC', str(year)), _text_frame('TCON', genre)]
+    if cover is not None:
+        frames.append(_frame('APIC', b'\x03image/jpeg\x00\x03\x00' + cover))
+    body = b''.join(frames)
+    return b'ID3\x04\x00\x00' + _syncsafe(len(body)) + body
+
+
+def _name(rng, cyrillic):
+    syllables = SYLLABLES_RU if cyrillic else SYLLABLES
+    return ''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def _title(rng):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+
+
+def _safe(name):
+    return ''.join('_' if ch in '/\\:*?"<>|' else ch for ch in name)
+
+
+def _corrupt(rng, kind):
+    if kind == 'truncated':
+        # Заголовок обещает большой тег, а файл кончается раньше
+        return b'ID3\x04\x00\x00' + _syncsafe(1 << 20) + rng.randbytes(rng.randint(10, 200))
+    if kind == 'garbage':
+        return rng.randbytes(rng.randint(500, 4000))
+    return b'<!DOCTYPE html><html><body>404 Not Found</body></html>'
+
+
+def _layout(rng, count):
+    """Раскладывает count файлов по исполнителям и альбомам; возвращает список описаний треков"""
+    entries = []
+    while len(entries) < count:
+        cyrillic = rng.random() < 0.3
+        artist = _name(rng, cyrillic) + ('' if rng.random() < 0.5 else ' ' + _name(rng, cyrillic))
+        for _ in range(rng.randint(1, 5)):
+            album = _title(rng)
+            year = rng.randint(1965, 2024)
+            genre = rng.choice(GENRES)
+            has_cover = rng.random() < COVER_SHARE
+            loose = rng.random() < LOOSE_SHARE
+            for track in range(1, rng.randint(6, 14) + 1):
+                title = _title(rng)
+                if loose:
+                    rel_path = os.path.join('Download', _safe(f'{artist} - {title} {len(entries)}.mp3'))
+                else:
+                    rel_path = os.path.join(_safe(artist), _safe(f'{album} ({year})'),
+                                            _safe(f'{track:02d} - {title}.mp3'))
+                entries.append((rel_path, title, artist, album, track, year, genre, has_cover))
+                if len(entries) == count:
+                    return entries
+    return entries
+
+
+def generate(root, count, seed=0):
+    """Создаёт медиатеку из count файлов в root или переиспользует уже созданную с теми же параметрами.
+
+    Возвращает манифест: число треков, файлов с обложками и битых файлов.
+    """
+    manifest_path = os.path.join(root, MANIFEST)
+    params = {'version': GENERATOR_VERSION, 'count': count, 'seed': seed}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if all(manifest.get(key) == value for key, value in params.items()):
+            return manifest
+        # Медиатека с другими параметрами создана этим же генератором — её можно удалить целиком
+        shutil.rmtree(root)
+    except (OSError, ValueError):
+        pass
+
+    rng = random.Random(seed)
+    with open(COVER_PATH, 'rb') as f:
+        cover = f.read()
+    covers = corrupt = 0
+    for rel_path, title, artist, album, track, year, genre, has_cover in _layout(rng, count):
+        path = os.path.join(root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if rng.random() < CORRUPT_SHARE:
+            data = _corrupt(rng, rng.choice(('truncated', 'garbage', 'html')))
+            corrupt += 1
+        else:
+            data = id3_tag(title, artist, album, track, year, genre, cover if has_cover else None)
+            data += FRAME * rng.randint(4, 12)
+            covers += has_cover
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    manifest = dict(params, tracks=count - corrupt, covers=covers, corrupt=corrupt)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Генерирует синтетическую медиатеку для бенчмарков')
+    parser.add_argument('root')
+    parser.add_argument('count', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.root, args.count, args.seed))
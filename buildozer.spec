@@ -37,7 +37,7 @@ version = 1.4
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy==2.3.1,mutagen==1.47.0,filetype==1.2.0
+requirements = python3,sqlite3,kivy==2.3.1,mutagen==1.47.0,filetype==1.2.0
 
 # (str) Custom source folders for requirements
 # Sets custom source for any requirements with recipes
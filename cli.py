@@ -0,0 +1,182 @@
+"""Командная строка для медиатеки без интерфейса.
+
+    python cli.py index ~/Music --workers 8 --processes
+    python cli.py covers
+    python cli.py validate
+    python cli.py export "Любимое" --format m3u --output loved.m3u
+    python cli.py smart "Новое без прослушиваний" --added-days 30 --never-played
+    python cli.py stats --json
+    python cli.py rebase ~/Music /storage/emulated/0/Music
+
+Индекс (library.db) и кэш обложек (covers/), собранные на компьютере, можно
+перенести на телефон: rebase меняет корень путей, а файлы нужно копировать
+с сохранением mtime, иначе приложение заново прочитает их теги.
+"""
+import os
+import sys
+import json
+import argparse
+from library import ScanOptions, INDEX_PATH, PROBE_WORKERS
+from playlists import PLAYLISTS_PATH
+from covers import COVERS_DIR
+from engine import LibraryEngine, SETTINGS_PATH, EXPORT_FORMATS
+from smart import make_definition
+
+
+def _print(data, as_json):
+    if as_json:
+        print(json.dumps(data, ensure_ascii=False, indent=1))
+    else:
+        for key, value in data.items():
+            print(f'{key}: {value}')
+
+
+def cmd_index(engine, args):
+    if args.roots:
+        current = engine.scan_options
+        engine.save_scan_options(ScanOptions(args.roots, args.exclude, args.max_depth, current.skip_hidden,
+                                             current.skip_names, current.watch, current.check_interval))
+    elif not os.path.exists(args.settings):
+        # Без сохранённых корней сканирование по умолчанию выбросило бы из индекса всю медиатеку
+        print(f'Корни медиатеки не заданы: укажите их (python cli.py index ~/Music), они сохранятся в '
+              f'{args.settings}', file=sys.stderr)
+        return 2
+    stats = engine.scan(args.full, workers=args.workers, processes=args.processes)
+    if args.json:
+        _print(stats.as_dict(), True)
+    else:
+        print(f'Сканирование: {stats}')
+    return 0
+
+
+def cmd_covers(engine, args):
+    def progress(done, total):
+        if done % 500 == 0 or done == total:
+            print(f'\rОбложки: {done}/{total}', end='' if done < total else '\n', file=sys.stderr)
+
+    _print(engine.build_covers(progress=progress), args.json)
+    return 0
+
+
+def cmd_validate(engine, args):
+    report = engine.validate_playlists()
+    broken = sum(1 for entry in report.values() if entry['missing'])
+    if args.json:
+        _print(report, True)
+    else:
+        for name, entry in report.items():
+            print(f"{name}: треков {entry['tracks']}, пропало {len(entry['missing'])}, "
+                  f"старого формата {entry['legacy']}")
+            for missing in entry['missing']:
+                print(f'    {missing}')
+    return 1 if broken else 0
+
+
+def cmd_export(engine, args):
+    names = list(engine.playlists) + list(engine.smart) if args.all else [args.name]
+    unknown = [name for name in names if name not in engine.playlists and name not in engine.smart]
+    if unknown or not names:
+        print(f'Нет такого плейлиста: {", ".join(unknown) or "(не указан)"}', file=sys.stderr)
+        return 2
+    for name in names:
+        if args.all:
+            os.makedirs(args.output or '.', exist_ok=True)
+            safe = ''.join('_' if ch in '/\\:*?"<>|' else ch for ch in name)
+            path = os.path.join(args.output or '.', f'{safe}.{args.format}')
+        else:
+            path = args.output or f'{name}.{args.format}'
+        count = engine.export_playlist(name, path, args.format)
+        print(f'{name}: {count} треков -> {path}')
+    return 0
+
+
+def cmd_smart(engine, args):
+    if args.name in engine.playlists:
+        print(f'Уже есть обычный плейлист {args.name}', file=sys.stderr)
+        return 2
+    definition = make_definition('any' if args.any else 'all', args.artist, args.album, args.title,
+                                 args.min_duration, args.max_duration, args.folder, args.added_days,
+                                 args.never_played)
+    engine.define_smart(args.name, definition)
+    print(f'{args.name}: {len(engine.playlist_paths(args.name))} треков')
+    return 0
+
+
+def cmd_stats(engine, args):
+    _print(engine.stats(), args.json)
+    return 0
+
+
+def cmd_rebase(engine, args):
+    engine.rebase(args.old_root, args.new_root)
+    print(f'Корень медиатеки: {args.old_root} -> {args.new_root}')
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Медиатека музыкального плеера без интерфейса')
+    parser.add_argument('--index', default=INDEX_PATH, help='файл индекса медиатеки')
+    parser.add_argument('--playlists', default=PLAYLISTS_PATH, help='файл плейлистов')
+    parser.add_argument('--covers', default=COVERS_DIR, help='каталог кэша обложек')
+    parser.add_argument('--settings', default=SETTINGS_PATH, help='настройки сканирования (JSON)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--json', action='store_true', help='вывод в JSON')
+
+    index = commands.add_parser('index', parents=[common], help='построить или обновить индекс')
+    index.add_argument('roots', nargs='*', help='корни медиатеки; они сохраняются в файл настроек и по умолчанию берутся из него')
+    index.add_argument('--exclude', action='append', default=[], help='исключить каталог (можно несколько)')
+    index.add_argument('--max-depth', type=int, default=None)
+    index.add_argument('--full', action='store_true', help='перечитать все каталоги и теги')
+    index.add_argument('--workers', type=int, default=PROBE_WORKERS, help='потоков или процессов для тегов')
+    index.add_argument('--processes', action='store_true', help='читать теги в процессах, а не в потоках')
+    index.set_defaults(handler=cmd_index)
+
+    commands.add_parser('covers', parents=[common], help='извлечь обложки всех треков в кэш').set_defaults(
+        handler=cmd_covers)
+    commands.add_parser('validate', parents=[common], help='проверить плейлисты на пропавшие треки').set_defaults(
+        handler=cmd_validate)
+
+    export = commands.add_parser('export', help='выгрузить плейлист')
+    export.add_argument('name', nargs='?')
+    export.add_argument('--all', action='store_true', help='выгрузить все плейлисты в каталог --output')
+    export.add_argument('--format', choices=EXPORT_FORMATS, default='m3u')
+    export.add_argument('--output', help='файл (или каталог с --all)')
+    export.set_defaults(handler=cmd_export)
+
+    smart = commands.add_parser('smart', help='создать умный плейлист или заменить его правила')
+    smart.add_argument('name')
+    smart.add_argument('--artist', help='исполнитель содержит')
+    smart.add_argument('--album', help='альбом содержит')
+    smart.add_argument('--title', help='название содержит')
+    smart.add_argument('--min-duration', type=float, help='не короче, секунд')
+    smart.add_argument('--max-duration', type=float, help='не длиннее, секунд')
+    smart.add_argument('--folder', help='только из этого каталога')
+    smart.add_argument('--added-days', type=float, help='добавлен не раньше, чем столько дней назад')
+    smart.add_argument('--never-played', action='store_true', help='ни разу не проигрывался')
+    smart.add_argument('--any', action='store_true', help='достаточно одного правила, а не всех')
+    smart.set_defaults(handler=cmd_smart)
+
+    commands.add_parser('stats', parents=[common], help='сводка по индексу, плейлистам и обложкам').set_defaults(
+        handler=cmd_stats)
+
+    rebase = commands.add_parser('rebase', help='перенести индекс и обложки на другой корень')
+    rebase.add_argument('old_root')
+    rebase.add_argument('new_root')
+    rebase.set_defaults(handler=cmd_rebase)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    engine = LibraryEngine(index_path=args.index, playlists_path=args.playlists, settings_path=args.settings,
+                           covers_dir=args.covers)
+    try:
+        engine.load_playlists()
+        return args.handler(engine, args)
+    finally:
+        engine.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
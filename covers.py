@@ -0,0 +1,218 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from formats import read_cover
+from library import rebase_column
+from perf import metrics
+
+COVERS_DIR = os.path.join('.', 'covers')
+COVER_SIZE = 1000
+MAX_DISK_BYTES = 64 * 1024 * 1024
+# Время использования обложек копится в памяти и пишется в базу пачками, а не на каждый показ
+USED_FLUSH = 64
+
+
+@metrics.timed('cover_extract')
+def extract_cover_art(track_path, output_path=None):
+    """Извлекает обложку из аудиофайла любого поддерживаемого формата и сохраняет её во временный файл."""
+    try:
+        cover_data = read_cover(track_path)
+        if cover_data:
+            if output_path:
+                with open(output_path, 'wb') as f:
+                    f.write(cover_data)
+
+            return cover_data
+    except Exception as e:
+        print(f"Ошибка при извлечении обложки: {e}")
+    return None
+
+
+def downscale_cover(data, size=COVER_SIZE):
+    """Уменьшает обложку до размера экрана; без Pillow возвращает исходные байты"""
+    try:
+        # Pillow тяжёлый, поэтому загружается при первой новой обложке, а не при старте
+        from PIL import Image as PILImage
+    except ImportError:
+        return data, '.png' if data.startswith(b'\x89PNG') else '.jpg'
+    try:
+        image = PILImage.open(BytesIO(data))
+        if max(image.size) <= size:
+            return data, '.png' if image.format == 'PNG' else '.jpg'
+        image.thumbnail((size, size))
+        out = BytesIO()
+        image.convert('RGB').save(out, 'JPEG', quality=85)
+        return out.getvalue(), '.jpg'
+    except Exception as e:
+        print(f"Ошибка при уменьшении обложки: {e}")
+        return data, '.jpg'
+
+
+class CoverCache:
+    """Дисковый кэш обложек с адресацией по содержимому.
+
+    Каждая уникальная обложка хранится один раз под хэшем своих байтов,
+    уменьшенная до размера экрана. Соответствие трек (путь, размер, mtime) ->
+    хэш запоминается, поэтому повторный показ не разбирает файл, а время
+    использования обложки только запоминается в памяти и пишется в базу
+    пачками. При превышении max_disk_bytes удаляются давно не использованные файлы.
+    """
+
+    def __init__(self, directory=COVERS_DIR, size=COVER_SIZE, max_disk_bytes=MAX_DISK_BYTES):
+        self.directory = directory
+        self.size = size
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        self.known = None
+        self.used = {}
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'covers.db'), check_same_thread=False)
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                file TEXT
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                file TEXT PRIMARY KEY,
+                bytes INTEGER NOT NULL,
+                used REAL NOT NULL
+            );
+        ''')
+
+    def _known(self):
+        """Соответствия трек -> обложка читаются при первом показе обложки, а не при запуске"""
+        if self.known is None:
+            self.known = {path: (size, mtime, file) for path, size, mtime, file in
+                          self.db.execute('SELECT path, size, mtime, file FROM tracks')}
+        return self.known
+
+    def cover_path(self, track_path):
+        """Возвращает путь к файлу обложки трека в кэше или None, если обложки нет"""
+        try:
+            st = os.stat(track_path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self._known().get(track_path)
+            if entry and entry[:2] == (st.st_size, st.st_mtime):
+                file = entry[2]
+                if file is None or os.path.exists(os.path.join(self.directory, file)):
+                    self.hits += 1
+                    if file is None:
+                        return None
+                    self.used[file] = time.time()
+                    if len(self.used) >= USED_FLUSH:
+                        self._flush_used()
+                    return os.path.join(self.directory, file)
+            self.misses += 1
+        file = self._store(extract_cover_art(track_path))
+        with self.lock, self.db:
+            self._known()[track_path] = (st.st_size, st.st_mtime, file)
+            self.db.execute('INSERT OR REPLACE INTO tracks (path, size, mtime, file) VALUES (?, ?, ?, ?)',
+                            (track_path, st.st_size, st.st_mtime, file))
+            if file:
+                self.db.execute('UPDATE files SET used = ? WHERE file = ?', (time.time(), file))
+        return os.path.join(self.directory, file) if file else None
+
+    def _store(self, data):
+        """Кладёт обложку в хранилище под хэшем содержимого и возвращает имя файла"""
+        if not data:
+            return None
+        digest = hashlib.sha1(data).hexdigest()
+        with self.lock:
+            row = self.db.execute('SELECT file FROM files WHERE file IN (?, ?)',
+                                  (digest + '.jpg', digest + '.png')).fetchone()
+        if row and os.path.exists(os.path.join(self.directory, row[0])):
+            return row[0]
+        scaled, ext = downscale_cover(data, self.size)
+        file = digest + ext
+        path = os.path.join(self.directory, file)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(scaled)
+        os.replace(tmp_path, path)
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO files (file, bytes, used) VALUES (?, ?, ?)',
+                            (file, len(scaled), time.time()))
+        self._evict()
+        return file
+
+    def _flush_used(self):
+        """Записывает накопленное время использования обложек"""
+        with self.lock, self.db:
+            used, self.used = self.used, {}
+            self.db.executemany('UPDATE files SET used = ? WHERE file = ?',
+                                [(when, file) for file, when in used.items()])
+
+    def _evict(self):
+        """Удаляет давно не использованные обложки, пока кэш больше max_disk_bytes"""
+        self._flush_used()
+        with self.lock, self.db:
+            total = self.db.execute('SELECT COALESCE(SUM(bytes), 0) FROM files').fetchone()[0]
+            if total <= self.max_disk_bytes:
+                return
+            evicted = set()
+            for file, size in self.db.execute('SELECT file, bytes FROM files ORDER BY used').fetchall():
+                if total <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, file))
+                except OSError:
+                    pass
+                self.db.execute('DELETE FROM files WHERE file = ?', (file,))
+                self.db.execute('DELETE FROM tracks WHERE file = ?', (file,))
+                evicted.add(file)
+                total -= size
+            self.known = {path: entry for path, entry in self._known().items() if entry[2] not in evicted}
+
+    def rebase(self, old_root, new_root):
+        """Переносит соответствия трек -> обложка на другой корень медиатеки"""
+        with self.lock, self.db:
+            rebase_column(self.db, 'tracks', 'path', old_root, new_root)
+            self.known = None
+
+    def stats(self):
+        with self.lock:
+            files, size = self.db.execute('SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM files').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'files': files, 'bytes': size,
+                'max_disk_bytes': self.max_disk_bytes}
+
+    def close(self):
+        with self.lock:
+            self._flush_used()
+            self.db.close()
+
+
+class TextureCache:
+    """Ограниченный LRU-кэш декодированных текстур обложек; loader(path) декодирует файл в текстуру"""
+
+    def __init__(self, capacity, loader):
+        self.capacity = capacity
+        self.loader = loader
+        self.textures = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        texture = self.textures.get(path)
+        if texture is not None:
+            self.textures.move_to_end(path)
+            self.hits += 1
+            return texture
+        self.misses += 1
+        texture = self.loader(path)
+        self.textures[path] = texture
+        if len(self.textures) > self.capacity:
+            self.textures.popitem(last=False)
+        return texture
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.textures), 'capacity': self.capacity}
@@ -0,0 +1,191 @@
+import os
+import json
+from library import LibraryIndex, ScanOptions, load_scan_options, rebase_path, is_track_id, INDEX_PATH
+from playlists import PlaylistStore, PLAYLISTS_PATH, write_atomic
+from covers import CoverCache, COVERS_DIR, MAX_DISK_BYTES
+
+SETTINGS_PATH = os.path.join('.', 'scan_settings.json')
+EXPORT_FORMATS = ('m3u', 'json')
+
+
+class LibraryEngine:
+    """Медиатека без интерфейса: индекс, настройки сканирования, плейлисты и кэш обложек.
+
+    Приложение держит один такой объект и поверх него строит экраны, а
+    cli.py пользуется им же для сборки индекса и обложек на компьютере,
+    проверки и выгрузки плейлистов и бенчмарков без дисплея. Kivy здесь не
+    импортируется; всё, что связано с потоками интерфейса, остаётся в main.py.
+    """
+
+    def __init__(self, roots=('.',), index_path=INDEX_PATH, playlists_path=PLAYLISTS_PATH,
+                 settings_path=SETTINGS_PATH, covers_dir=COVERS_DIR, max_cover_bytes=MAX_DISK_BYTES,
+                 scan_options=None):
+        self.library = LibraryIndex(index_path)
+        self.settings_path = settings_path
+        self.scan_options = scan_options or load_scan_options(settings_path, roots)
+        self.playlist_store = PlaylistStore(playlists_path)
+        self.playlists = self.playlist_store.playlists
+        self.smart = self.playlist_store.smart
+        self.covers = CoverCache(covers_dir, max_disk_bytes=max_cover_bytes)
+
+    def load_playlists(self):
+        """Загружает плейлисты из файла и журнала изменений и передаёт правила умных плейлистов индексу"""
+        try:
+            self.playlist_store.load()
+        except Exception as e:
+            print(f"Ошибка при загрузке плейлистов: {e}")
+        for name, definition in self.smart.items():
+            try:
+                self.library.define_smart(name, definition)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"Ошибка в правилах умного плейлиста {name}: {e}")
+
+    def load_library(self):
+        """Загружает метаданные из индекса без обхода файловой системы и возвращает пути треков"""
+        self.library.load_metadata()
+        return self.library.paths()
+
+    def save_scan_options(self, options):
+        """Делает options текущими настройками сканирования и сохраняет их в файл настроек.
+
+        Сканирование удаляет из индекса всё вне корней, поэтому корни, с которыми
+        индекс собран, должны сохраняться — иначе следующий запуск без них
+        возьмёт корни по умолчанию и выбросит медиатеку.
+        """
+        self.scan_options = options
+        settings = {'roots': options.roots, 'exclude': options.exclude, 'max_depth': options.max_depth,
+                    'skip_hidden': options.skip_hidden, 'skip_names': sorted(options.skip_names),
+                    'watch': options.watch, 'check_interval': options.check_interval}
+        write_atomic(self.settings_path, json.dumps(settings, ensure_ascii=False, indent=1))
+
+    def scan(self, full=False, stats=None, **kwargs):
+        """Обновляет индекс по настройкам сканирования и перепривязывает плейлисты; возвращает счётчики"""
+        stats = self.library.rescan(self.scan_options, full, stats, **kwargs)
+        self.sync_playlists(link=not stats.cancelled)
+        return stats
+
+    def link_playlists(self):
+        """Переводит пути в плейлистах старого формата на идентификаторы треков из индекса"""
+        paths = {entry for tracks in self.playlists.values() for entry in tracks if not is_track_id(entry)}
+        if not paths:
+            return []
+        return self.playlist_store.relink(self.library.track_ids(paths))
+
+    def sync_playlists(self, link=True):
+        """После изменений индекса заменяет сменившиеся идентификаторы треков и, если link,
+        переводит пути старого формата на идентификаторы. Возвращает имена изменённых плейлистов.
+        """
+        changed = set(self.playlist_store.relink(self.library.take_id_changes()))
+        if link:
+            changed.update(self.link_playlists())
+        return changed
+
+    def define_smart(self, name, definition):
+        """Создаёт умный плейлист или меняет его правила; неверные правила отвергаются до записи"""
+        self.library.define_smart(name, definition)
+        self.playlist_store.set_smart(name, definition)
+
+    def delete_playlist(self, name):
+        """Удаляет обычный или умный плейлист"""
+        self.playlist_store.delete(name)
+        self.library.remove_smart(name)
+
+    def playlist_paths(self, name):
+        """Пути треков плейлиста для воспроизведения: у умного — текущий состав, у обычного — найденные в индексе"""
+        if name in self.smart:
+            return self.library.smart_paths(name)
+        return [path for path in self.library.resolve(self.playlists.get(name, [])) if path]
+
+    def delete_file(self, path):
+        """Удаляет файл трека с диска и точечно убирает его из индекса"""
+        os.remove(path)
+        self.library.update_paths([path])
+
+    def build_covers(self, paths=None, progress=None):
+        """Заранее извлекает обложки треков в кэш; progress(done, total) вызывается по ходу.
+
+        Возвращает число треков с обложкой и сколько из них пришлось извлекать.
+        """
+        if paths is None:
+            self.library.load_metadata()
+            with_cover = sorted(self.library.select('has_cover', bool))
+        else:
+            with_cover = []
+            for path in paths:
+                meta = self.library.metadata(path)
+                if meta is not None and meta.has_cover:
+                    with_cover.append(path)
+        misses = self.covers.misses
+        for done, path in enumerate(with_cover, 1):
+            self.covers.cover_path(path)
+            if progress is not None:
+                progress(done, len(with_cover))
+        return {'with_cover': len(with_cover), 'extracted': self.covers.misses - misses}
+
+    def validate_playlists(self):
+        """Проверяет плейлисты: для каждого — число записей, пропавшие треки и записи старого формата"""
+        report = {}
+        for name, entries in self.playlists.items():
+            resolved = self.library.resolve(entries)
+            missing = [entry for entry, path in zip(entries, resolved) if path is None or not os.path.exists(path)]
+            report[name] = {'tracks': len(entries), 'missing': missing,
+                            'legacy': sum(1 for entry in entries if not is_track_id(entry))}
+        return report
+
+    def export_playlist(self, name, path, fmt='m3u'):
+        """Выгружает плейлист в M3U (пути и #EXTINF) или JSON (идентификаторы, пути и теги).
+
+        Пропавшие треки в M3U пропускаются, в JSON остаются с path = null. Возвращает число треков.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f'Неизвестный формат выгрузки: {fmt}')
+        # Записи умного плейлиста — пути его текущего состава
+        entries = self.library.smart_paths(name) if name in self.smart else self.playlists[name]
+        tracks = []
+        for entry, track_path in zip(entries, self.library.resolve(entries)):
+            meta = self.library.metadata(track_path) if track_path else None
+            tracks.append((entry, track_path, meta))
+        if fmt == 'm3u':
+            lines = ['#EXTM3U', f'#PLAYLIST:{name}']
+            for entry, track_path, meta in tracks:
+                if track_path is None:
+                    continue
+                if meta is not None:
+                    lines.append(f'#EXTINF:{int(meta.duration or 0)},{meta.artist} - {meta.title}')
+                lines.append(os.path.abspath(track_path))
+            data = '\n'.join(lines) + '\n'
+        else:
+            data = json.dumps({'name': name, 'tracks': [
+                {'id': entry if is_track_id(entry) else None, 'path': track_path,
+                 'title': meta.title if meta else None, 'artist': meta.artist if meta else None,
+                 'album': meta.album if meta else None, 'duration': meta.duration if meta else None}
+                for entry, track_path, meta in tracks]}, ensure_ascii=False, indent=1)
+        write_atomic(path, data)
+        return sum(1 for _, track_path, _ in tracks if track_path is not None)
+
+    def rebase(self, old_root, new_root):
+        """Переносит индекс, кэш обложек и сохранённые корни сканирования на другой корень медиатеки.
+
+        Корни переносятся вместе с индексом: иначе следующее сканирование не
+        нашло бы ничего под старым корнем и выбросило бы всю медиатеку.
+        """
+        self.library.rebase(old_root, new_root)
+        self.covers.rebase(old_root, new_root)
+        options = self.scan_options
+        roots = [rebase_path(root, old_root, new_root) for root in options.roots]
+        exclude = [rebase_path(path, old_root, new_root) for path in options.exclude]
+        if roots != options.roots or exclude != options.exclude:
+            self.save_scan_options(ScanOptions(roots, exclude, options.max_depth, options.skip_hidden,
+                                               options.skip_names, options.watch, options.check_interval))
+
+    def stats(self):
+        """Сводка по индексу, плейлистам и кэшу обложек"""
+        return {'index': self.library.counts(),
+                'playlists': {name: len(entries) for name, entries in self.playlists.items()},
+                'smart': {name: len(self.library.smart_paths(name)) for name in self.smart},
+                'covers': self.covers.stats()}
+
+    def close(self):
+        self.playlist_store.flush()
+        self.library.close()
+        self.covers.close()
@@ -0,0 +1,165 @@
+import os
+import base64
+
+AUDIO_EXTENSIONS = ('.mp3', '.flac', '.ogg', '.oga', '.opus', '.m4a')
+HEADER_BYTES = 262
+UNKNOWN_TITLE = 'Unknown Title'
+UNKNOWN_ARTIST = 'Unknown Artist'
+
+
+def is_audio_name(name):
+    """Быстрый отбор по имени файла; содержимое потом проверяется по заголовку"""
+    return name.lower().endswith(AUDIO_EXTENSIONS)
+
+
+def _fields(audio, title, artist, album, has_cover):
+    return {
+        'title': str(title),
+        'artist': str(artist),
+        'album': str(album),
+        'duration': audio.info.length,
+        'bitrate': getattr(audio.info, 'bitrate', 0) or 0,
+        'has_cover': has_cover,
+    }
+
+
+def _first(tags, key, default):
+    values = tags.get(key) if tags is not None else None
+    return values[0] if values else default
+
+
+def _read_mp3(path):
+    from mutagen.mp3 import MP3
+    audio = MP3(path)
+    tags = audio.tags or {}
+    return _fields(audio, audio.get('TIT2', UNKNOWN_TITLE), audio.get('TPE1', UNKNOWN_ARTIST),
+                   audio.get('TALB', ''), any(key.startswith('APIC') for key in tags.keys()))
+
+
+def _mp3_cover(path):
+    from mutagen.mp3 import MP3
+    tags = MP3(path).tags
+    if tags is None:
+        return None
+    for tag in tags.values():
+        if tag.FrameID == 'APIC':
+            return tag.data
+    return None
+
+
+def _read_vorbis(audio):
+    tags = audio.tags
+    pictures = getattr(audio, 'pictures', None)
+    has_cover = bool(pictures) or bool(tags is not None and tags.get('metadata_block_picture'))
+    return _fields(audio, _first(tags, 'title', UNKNOWN_TITLE), _first(tags, 'artist', UNKNOWN_ARTIST),
+                   _first(tags, 'album', ''), has_cover)
+
+
+def _vorbis_cover(audio):
+    if getattr(audio, 'pictures', None):
+        return audio.pictures[0].data
+    encoded = _first(audio.tags, 'metadata_block_picture', None)
+    if encoded is None:
+        return None
+    from mutagen.flac import Picture
+    return Picture(base64.b64decode(encoded)).data
+
+
+def _open_flac(path):
+    from mutagen.flac import FLAC
+    return FLAC(path)
+
+
+def _open_ogg(path):
+    # Внутри Ogg может быть Vorbis, Opus или FLAC: mutagen сам выбирает по первому пакету
+    import mutagen
+    from mutagen.oggvorbis import OggVorbis
+    from mutagen.oggopus import OggOpus
+    from mutagen.oggflac import OggFLAC
+    audio = mutagen.File(path, options=[OggVorbis, OggOpus, OggFLAC])
+    if audio is None:
+        raise ValueError('Неизвестный кодек в контейнере Ogg')
+    return audio
+
+
+def _read_mp4(path):
+    from mutagen.mp4 import MP4
+    audio = MP4(path)
+    tags = audio.tags
+    return _fields(audio, _first(tags, '\xa9nam', UNKNOWN_TITLE), _first(tags, '\xa9ART', UNKNOWN_ARTIST),
+                   _first(tags, '\xa9alb', ''), bool(tags is not None and tags.get('covr')))
+
+
+def _mp4_cover(path):
+    from mutagen.mp4 import MP4
+    cover = _first(MP4(path).tags, 'covr', None)
+    return bytes(cover) if cover is not None else None
+
+
+class AudioFormat:
+    """Формат из реестра: MIME-типы, которые filetype находит по заголовку, расширения файлов
+    и функции чтения тегов и обложки
+    """
+
+    def __init__(self, name, mimes, extensions, read, cover):
+        self.name = name
+        self.mimes = mimes
+        self.extensions = extensions
+        self.read = read
+        self.cover = cover
+
+
+FORMATS = [
+    AudioFormat('mp3', ('audio/mpeg',), ('.mp3',), _read_mp3, _mp3_cover),
+    AudioFormat('flac', ('audio/x-flac',), ('.flac',),
+                lambda path: _read_vorbis(_open_flac(path)), lambda path: _vorbis_cover(_open_flac(path))),
+    AudioFormat('ogg', ('audio/ogg',), ('.ogg', '.oga', '.opus'),
+                lambda path: _read_vorbis(_open_ogg(path)), lambda path: _vorbis_cover(_open_ogg(path))),
+    # M4A без бренда M4A filetype считает видео MP4; это тот же контейнер, и mutagen его читает
+    AudioFormat('m4a', ('audio/mp4', 'video/mp4'), ('.m4a',), _read_mp4, _mp4_cover),
+]
+FORMATS_BY_MIME = {mime: audio_format for audio_format in FORMATS for mime in audio_format.mimes}
+FORMATS_BY_EXTENSION = {extension: audio_format for audio_format in FORMATS
+                        for extension in audio_format.extensions}
+
+
+def sniff(path):
+    """Определяет формат по первым байтам файла; для не-аудио и неподдерживаемых форматов — None"""
+    import filetype
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_BYTES)
+    kind = filetype.guess(header)
+    return FORMATS_BY_MIME.get(kind.mime) if kind is not None else None
+
+
+def by_extension(path):
+    return FORMATS_BY_EXTENSION.get(os.path.splitext(path)[1].lower())
+
+
+def read_tags(path):
+    """Читает теги и параметры потока любого поддерживаемого формата.
+
+    Формат определяется по заголовку. Заголовки, которых filetype не знает
+    (MP3 с CRC, с нулями перед первым кадром, в обёртке RIFF), читаются по
+    расширению файла, и ValueError бросается, только если mutagen тоже не смог
+    их разобрать. Ошибки разбора файла с распознанным заголовком
+    пробрасываются из mutagen как есть.
+    """
+    audio_format = sniff(path)
+    if audio_format is not None:
+        return audio_format.read(path)
+    audio_format = by_extension(path)
+    if audio_format is None:
+        raise ValueError(f'Неподдерживаемый формат: {os.path.basename(path)}')
+    try:
+        return audio_format.read(path)
+    except Exception as e:
+        raise ValueError(f'Неподдерживаемый формат: {os.path.basename(path)}') from e
+
+
+def read_cover(path):
+    """Возвращает байты встроенной обложки или None"""
+    audio_format = sniff(path) or by_extension(path)
+    if audio_format is None:
+        return None
+    return audio_format.cover(path)
@@ -0,0 +1,907 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from formats import read_tags, is_audio_name
+from perf import metrics
+from tracktable import TrackTable
+from views import TrackViews, SORT_ORDERS
+from smart import SmartPlaylists
+
+INDEX_PATH = os.path.join('.', 'library.db')
+SCHEMA_VERSION = 5
+TRACK_ID_LENGTH = 16
+HEX_DIGITS = set('0123456789abcdef')
+SYSTEM_DIRS = {'Android', 'LOST.DIR', 'cache', 'Cache', 'Thumbnails', '__pycache__'}
+PROBE_WORKERS = min(8, os.cpu_count() or 2)
+PROBE_QUEUE_PER_WORKER = 4
+PROBE_CHUNK = 16
+COMMIT_BATCH = 500
+CHECK_INTERVAL = 60
+
+
+def normalize_path(path):
+    return path.replace('\\', '/')
+
+
+def row_dir(path):
+    return normalize_path(os.path.dirname(path))
+
+
+def track_fingerprint(size, title, artist, album, duration):
+    """Идентификатор трека по тегам и размеру файла: не меняется при переносе и переименовании"""
+    key = f'{size}\0{title}\0{artist}\0{album}\0{round(duration or 0, 1)}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:TRACK_ID_LENGTH]
+
+
+def is_track_id(entry):
+    """Отличает идентификатор трека от пути в записях плейлистов старого формата"""
+    return len(entry) == TRACK_ID_LENGTH and HEX_DIGITS.issuperset(entry)
+
+
+def probe_file(path, size, mtime):
+    """Читает теги одного файла в пуле; функция верхнего уровня, чтобы её можно было отдать и в процесс"""
+    try:
+        with metrics.timer('tag_parse'):
+            return path, size, mtime, read_tags(path), None
+    except Exception as e:
+        return path, size, mtime, None, str(e) or type(e).__name__
+
+
+def probe_files(jobs):
+    """Читает теги пачки файлов (path, size, mtime) за одно задание пула"""
+    return [probe_file(*job) for job in jobs]
+
+
+def _same_file(path, size, mtime):
+    """Совпадают ли размер и mtime файла с записанными в индексе"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == size and st.st_mtime == mtime
+
+
+def _is_under(path, root):
+    return path == root or path.startswith(root.rstrip('/') + '/')
+
+
+def _clean_root(path):
+    path = normalize_path(path)
+    return path.rstrip('/') or '/'
+
+
+def rebase_path(path, old_root, new_root):
+    """Заменяет в пути префикс old_root на new_root; пути вне old_root возвращает как есть"""
+    path, old_root, new_root = _clean_root(path), _clean_root(old_root), _clean_root(new_root)
+    if not _is_under(path, old_root):
+        return path
+    return new_root + path[len(old_root):] if old_root != '/' else new_root.rstrip('/') + path
+
+
+def rebase_column(db, table, column, old_root, new_root):
+    """Заменяет в столбце префикс пути old_root на new_root; остальные пути не трогает"""
+    old_root = _clean_root(old_root)
+    new_root = _clean_root(new_root)
+    old_prefix = old_root.rstrip('/') + '/'
+    db.execute(f'UPDATE {table} SET {column} = ? WHERE {column} = ?', (new_root, old_root))
+    db.execute(f'UPDATE {table} SET {column} = ? || substr({column}, ?) WHERE substr({column}, 1, ?) = ?',
+               (new_root.rstrip('/') + '/', len(old_prefix) + 1, len(old_prefix), old_prefix))
+
+
+class ScanOptions:
+    """Настройки обхода: корни, исключения, глубина и отсечение скрытых и системных каталогов"""
+
+    def __init__(self, roots, exclude=(), max_depth=None, skip_hidden=True, skip_names=SYSTEM_DIRS,
+                 watch=False, check_interval=CHECK_INTERVAL):
+        self.roots = [_clean_root(root) for root in roots]
+        self.exclude = [_clean_root(path) for path in exclude]
+        self.max_depth = max_depth
+        self.skip_hidden = skip_hidden
+        self.skip_names = set(skip_names)
+        # Следить за изменениями через inotify; иначе раз в check_interval секунд сверяются mtime каталогов
+        self.watch = watch
+        self.check_interval = check_interval
+
+    def allows(self, path, depth):
+        """Проверяет, нужно ли спускаться в каталог path на глубине depth"""
+        if self.max_depth is not None and depth > self.max_depth:
+            return False
+        name = path.rsplit('/', 1)[-1]
+        if self.skip_hidden and name.startswith('.'):
+            return False
+        if name in self.skip_names:
+            return False
+        return not any(_is_under(path, excluded) for excluded in self.exclude)
+
+    def depth(self, path):
+        """Глубина каталога относительно ближайшего корня или None, если он вне корней"""
+        for root in self.roots:
+            if _is_under(path, root):
+                return path[len(root.rstrip('/')):].count('/')
+        return None
+
+
+def load_scan_options(path, roots, exclude=()):
+    """Загружает настройки сканирования из JSON-файла, если он есть, иначе берёт значения по умолчанию"""
+    settings = {}
+    try:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                settings = json.load(f)
+    except Exception as e:
+        print(f"Ошибка при загрузке настроек сканирования: {e}")
+    return ScanOptions(settings.get('roots', roots),
+                       settings.get('exclude', exclude),
+                       settings.get('max_depth'),
+                       settings.get('skip_hidden', True),
+                       settings.get('skip_names', SYSTEM_DIRS),
+                       settings.get('watch', False),
+                       settings.get('check_interval', CHECK_INTERVAL))
+
+
+class ScanStats:
+    """Счётчики одного прохода сканера"""
+
+    def __init__(self):
+        self.dirs_visited = 0
+        self.dirs_listed = 0
+        self.dirs_pruned = 0
+        self.files_visited = 0
+        self.tracks_found = 0
+        self.tags_read = 0
+        self.files_rejected = 0
+        self.cancelled = False
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def finish(self, cancelled=False):
+        self.cancelled = cancelled
+        self.elapsed = time.monotonic() - self.started
+
+    def as_dict(self):
+        return {name: value for name, value in vars(self).items() if name != 'started'}
+
+    def __str__(self):
+        return (f'каталогов {self.dirs_visited} (перечитано {self.dirs_listed}, отсечено {self.dirs_pruned}), '
+                f'файлов {self.files_visited}, треков {self.tracks_found}, '
+                f'прочитано тегов {self.tags_read}, отброшено {self.files_rejected}, {self.elapsed:.2f} с')
+
+
+class TrackMeta:
+    """Метаданные трека вместе с размером и mtime файла, по которым они были прочитаны"""
+    __slots__ = ('path', 'size', 'mtime', 'title', 'artist', 'album', 'duration', 'bitrate', 'has_cover',
+                 'track_id', 'added')
+
+    def __init__(self, path, size, mtime, title='Unknown Title', artist='Unknown Artist', album='',
+                 duration=0, bitrate=0, has_cover=False, track_id=None, added=0):
+        self.path = path
+        self.size = size
+        self.mtime = mtime
+        self.title = title
+        self.artist = artist
+        self.album = album
+        self.duration = duration
+        self.bitrate = bitrate
+        self.has_cover = bool(has_cover)
+        self.track_id = track_id or track_fingerprint(size, title, artist, album, duration)
+        # Когда трек появился в медиатеке: st_ctime файла при первом чтении, дальше не меняется
+        self.added = added
+
+    @property
+    def display_name(self):
+        return f'{self.title} - {self.artist}'
+
+    def matches(self, st):
+        return self.size == st.st_size and self.mtime == st.st_mtime
+
+    def record(self):
+        """Поля в порядке TRACK_COLUMNS"""
+        return (self.path, self.size, self.mtime, self.title, self.artist, self.album,
+                self.duration, self.bitrate, self.has_cover, self.track_id, self.added)
+
+    def as_row(self, dir_path):
+        return (self.path, dir_path, self.size, self.mtime, self.title, self.artist, self.album,
+                self.duration, self.bitrate, int(self.has_cover), self.track_id, self.added)
+
+
+class _PendingDir:
+    """Перечитанный каталог, теги файлов которого ещё читаются в пуле"""
+    __slots__ = ('path', 'parent', 'mtime', 'files', 'stored', 'rejected', 'skipped', 'jobs', 'waiting',
+                 'changed', 'failed')
+
+    def __init__(self, path, parent, mtime, files):
+        self.path = path
+        self.parent = parent
+        self.mtime = mtime
+        self.files = files
+        self.stored = {}
+        self.rejected = {}
+        self.skipped = set()
+        self.jobs = []
+        self.waiting = set()
+        self.changed = []
+        self.failed = {}
+
+    def add_result(self, path, size, mtime, fields, error):
+        self.waiting.discard(path)
+        if fields is None:
+            print('Error:', error, 'Error file:', path)
+            self.failed[path] = (path, self.path, size, mtime, error)
+        else:
+            self.changed.append(TrackMeta(path, size, mtime, added=self.files[path].st_ctime, **fields))
+
+
+TRACK_COLUMNS = 'path, size, mtime, title, artist, album, duration, bitrate, has_cover, track_id, added'
+INSERT_TRACK = ('INSERT OR REPLACE INTO tracks '
+                '(path, dir, size, mtime, title, artist, album, duration, bitrate, has_cover, track_id, added) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)')
+SQL_CHUNK = 500
+
+
+class LibraryIndex:
+    """Постоянный индекс медиатеки в SQLite: пути, размеры, mtime и теги.
+
+    Поверх таблицы держится общий кэш метаданных в памяти — колоночная
+    TrackTable, из которой читают все списки интерфейса; сканер обновляет её
+    вместе с индексом. metadata() собирает TrackMeta из колонок по запросу,
+    а display_name() и select() обходятся без этого. Треки вне корней
+    сканирования, открытые из плейлистов, держатся отдельно в loose. Порядки
+    сортировки и группы по исполнителям и альбомам (views) обновляются вместе
+    с таблицей.
+
+    Плейлисты ссылаются на треки по track_id — отпечатку тегов и размера, —
+    поэтому перенесённый файл находится по тому же идентификатору.
+    Если теги файла поменялись на месте, пара старый -> новый идентификатор
+    копится в id_changes, чтобы плейлисты перепривязались одним проходом.
+    Дата добавления (added) у перенесённого или переименованного файла
+    остаётся прежней: новый путь с уже известным track_id наследует её от
+    старой записи — ещё не удалённой или удалённой недавно (moved_from).
+    Пути треков, теги которых сканер прочитал заново, копятся в changed_paths —
+    по ним после сканирования обновляется поиск, не перечитывая всю медиатеку.
+
+    Файлы, которые оказались не аудио или не читаются, записываются в таблицу
+    rejected вместе с размером и mtime и не проверяются снова, пока не изменятся.
+
+    Прослушивания хранятся в таблице plays по track_id. Это уже не кэш, поэтому
+    при смене схемы она не удаляется; в памяти держится множество played с
+    идентификаторами (числами, как в TrackTable) для правил умных плейлистов.
+    """
+
+    def __init__(self, path=INDEX_PATH):
+        self.path = path
+        self.lock = threading.RLock()
+        self.loose = {}
+        self.complete = False
+        self.id_changes = {}
+        self.changed_paths = set()
+        self.moved_from = {}
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self._create_schema()
+        self.played = {int(track_id, 16) for (track_id,) in self.db.execute('SELECT track_id FROM plays')}
+        self.smart = None
+        self._attach(TrackTable())
+
+    def _attach(self, table):
+        """Заводит новую таблицу в памяти вместе с порядками и умными плейлистами поверх неё"""
+        definitions = self.smart.definitions if self.smart is not None else {}
+        self.table = table
+        self.views = TrackViews(table)
+        self.smart = SmartPlaylists(table, self.played)
+        for name, definition in definitions.items():
+            self.smart.define(name, definition)
+
+    def _create_schema(self):
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            # Индекс — это кэш, поэтому при смене схемы он просто строится заново
+            self.db.executescript('''
+                DROP TABLE IF EXISTS tracks;
+                DROP TABLE IF EXISTS dirs;
+                DROP TABLE IF EXISTS rejected;
+            ''')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                title TEXT,
+                artist TEXT,
+                album TEXT,
+                duration REAL,
+                bitrate INTEGER,
+                has_cover INTEGER,
+                track_id TEXT NOT NULL,
+                added REAL
+            );
+            CREATE INDEX IF NOT EXISTS tracks_dir ON tracks(dir);
+            CREATE INDEX IF NOT EXISTS tracks_id ON tracks(track_id);
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+            CREATE TABLE IF NOT EXISTS rejected (
+                path TEXT PRIMARY KEY,
+                dir TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                reason TEXT
+            );
+            CREATE INDEX IF NOT EXISTS rejected_dir ON rejected(dir);
+            CREATE TABLE IF NOT EXISTS plays (
+                track_id TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                last_played REAL NOT NULL
+            );
+        ''')
+        self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        self.db.commit()
+
+    def paths(self):
+        """Возвращает пути всех проиндексированных треков.
+
+        После load_metadata() таблица в памяти совпадает с индексом, и пути
+        берутся из неё — это те же строки, что в таблице, а не их копии.
+        """
+        with self.lock:
+            if self.complete:
+                return sorted(self.table.rows)
+            return [row[0] for row in self.db.execute('SELECT path FROM tracks ORDER BY path')]
+
+    def load_metadata(self):
+        """Загружает метаданные всех треков из индекса в таблицу в памяти одним запросом"""
+        with self.lock:
+            # Массовая загрузка: порядки дешевле построить заново, чем вставлять в них по треку
+            self.views.invalidate()
+            self.smart.invalidate()
+            add = self.table.add
+            for row in self.db.execute(f'SELECT {TRACK_COLUMNS} FROM tracks ORDER BY path'):
+                add(*row)
+            self.complete = True
+
+    def _remember(self, meta):
+        self.table.add(*meta.record())
+
+    def _forget(self, path):
+        self.table.remove(path)
+        self.loose.pop(path, None)
+
+    def track_ids(self, paths):
+        """Возвращает идентификаторы для путей из индекса; файлы вне индекса в словарь не попадают"""
+        paths = list(paths)
+        result = {}
+        with self.lock:
+            for start in range(0, len(paths), SQL_CHUNK):
+                chunk = paths[start:start + SQL_CHUNK]
+                marks = ', '.join('?' * len(chunk))
+                result.update(self.db.execute(f'SELECT path, track_id FROM tracks WHERE path IN ({marks})', chunk))
+        return result
+
+    def resolve(self, entries):
+        """Переводит записи плейлиста в пути: идентификаторы ищутся в индексе, старые пути остаются как есть.
+
+        Для пропавших треков возвращается None.
+        """
+        with self.lock:
+            table = self.table
+            missing = [entry for entry in entries if is_track_id(entry) and table.row_of_id(entry) is None]
+            # Найденные в индексе треки заодно попадают в таблицу: их всё равно сейчас покажут
+            for start in range(0, len(missing), SQL_CHUNK):
+                chunk = missing[start:start + SQL_CHUNK]
+                marks = ', '.join('?' * len(chunk))
+                for row in self.db.execute(f'SELECT {TRACK_COLUMNS} FROM tracks WHERE track_id IN ({marks})', chunk):
+                    table.add(*row)
+            result = []
+            for entry in entries:
+                if is_track_id(entry):
+                    row = table.row_of_id(entry)
+                    entry = table.path[row] if row is not None else None
+                result.append(entry)
+            return result
+
+    def take_id_changes(self):
+        """Отдаёт накопленные замены идентификаторов (теги изменились на месте) и очищает их"""
+        with self.lock:
+            changes, self.id_changes = self.id_changes, {}
+        return changes
+
+    def _inherit_added(self, meta):
+        """Новый путь трека: если такой track_id уже был в индексе, файл перенесён — дата добавления прежняя"""
+        row = self.db.execute('SELECT added FROM tracks WHERE track_id = ? AND path != ?',
+                              (meta.track_id, meta.path)).fetchone()
+        added = row[0] if row is not None else self.moved_from.pop(meta.track_id, None)
+        if added:
+            meta.added = added
+
+    def take_changed_paths(self):
+        """Отдаёт пути треков, прочитанных сканером заново с прошлого вызова, и очищает их"""
+        with self.lock:
+            changed, self.changed_paths = self.changed_paths, set()
+        return changed
+
+    def metadata(self, path):
+        """Возвращает метаданные трека, читая теги только если файла нет в кэше или он изменился"""
+        with self.lock:
+            row = self.table.rows.get(path)
+            if row is not None:
+                return TrackMeta(*self.table.record(row))
+            meta = self.loose.get(path)
+        if meta is not None:
+            return meta
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            row = self.db.execute(f'SELECT {TRACK_COLUMNS} FROM tracks WHERE path = ?', (path,)).fetchone()
+        stored = meta = TrackMeta(*row) if row else None
+        if meta is None or not meta.matches(st):
+            meta, error = self._probe(path, st)
+            if meta is None:
+                return None
+            # Файлы вне корней сканирования (например, из плейлистов) держим только в памяти
+            if stored is not None:
+                meta.added = stored.added
+                with self.lock, self.db:
+                    self.db.execute(INSERT_TRACK, meta.as_row(row_dir(path)))
+                    if stored.track_id != meta.track_id:
+                        self.id_changes[stored.track_id] = meta.track_id
+        with self.lock:
+            if row:
+                self._forget(path)
+                self._remember(meta)
+            else:
+                self.loose[path] = meta
+        return meta
+
+    def display_name(self, path):
+        """Строка трека для списков; для треков из таблицы — прямо из колонок, без сборки TrackMeta"""
+        with self.lock:
+            row = self.table.rows.get(path)
+            if row is not None:
+                return self.table.display_name(row)
+        meta = self.metadata(path)
+        return meta.display_name if meta is not None else None
+
+    def select(self, column, predicate):
+        """Пути треков из таблицы, значение колонки у которых удовлетворяет predicate (см. TrackTable.select)"""
+        with self.lock:
+            return self.table.paths_of(self.table.select(column, predicate))
+
+    def sorted_paths(self, order, reverse=False):
+        """Пути треков таблицы в порядке сортировки order из views.SORT_ORDERS"""
+        with self.lock:
+            rows = self.views.order(order)
+            return self.table.paths_of(reversed(rows) if reverse else rows)
+
+    def artists(self):
+        """Исполнители медиатеки по алфавиту: (номер, имя, альбомов, треков)"""
+        with self.lock:
+            views, names = self.views, self.table.artists.strings
+            return [(artist, names[artist], len(views.groups[artist]),
+                     sum(len(rows) for rows in views.groups[artist].values())) for artist in views.artist_ids()]
+
+    def albums(self, artist):
+        """Альбомы исполнителя по алфавиту: (номер, название, треков)"""
+        with self.lock:
+            views, names = self.views, self.table.albums.strings
+            return [(album, names[album], len(views.album_rows(artist, album))) for album in views.album_ids(artist)]
+
+    def group_paths(self, artist, album=None):
+        """Треки исполнителя по альбомам или одного его альбома"""
+        with self.lock:
+            rows = self.views.artist_rows(artist) if album is None else self.views.album_rows(artist, album)
+            return self.table.paths_of(rows)
+
+    def define_smart(self, name, definition):
+        """Задаёт или меняет правила умного плейлиста; состав посчитается при первом запросе"""
+        with self.lock:
+            self.smart.define(name, definition)
+
+    def remove_smart(self, name):
+        with self.lock:
+            self.smart.remove(name)
+
+    def smart_paths(self, name):
+        """Пути треков умного плейлиста по уже посчитанному составу.
+
+        Правила проверяются по всей медиатеке, поэтому без загруженной таблицы она сначала загружается.
+        """
+        with self.lock:
+            if not self.complete:
+                self.load_metadata()
+            return self.smart.paths(name)
+
+    def record_play(self, path):
+        """Засчитывает прослушивание трека; возвращает имена умных плейлистов, состав которых от этого изменился"""
+        with self.lock:
+            row = self.table.rows.get(path)
+            if row is not None:
+                track_id = f'{self.table.track_id[row]:016x}'
+            else:
+                found = self.db.execute('SELECT track_id FROM tracks WHERE path = ?', (path,)).fetchone()
+                if found is None:
+                    return []
+                track_id = found[0]
+            number = int(track_id, 16)
+            with self.db:
+                self.db.execute('INSERT OR IGNORE INTO plays (track_id, count, last_played) VALUES (?, 0, 0)',
+                                (track_id,))
+                self.db.execute('UPDATE plays SET count = count + 1, last_played = ? WHERE track_id = ?',
+                                (time.time(), track_id))
+            if number in self.played:
+                return []
+            self.played.add(number)
+            return self.smart.refresh(row) if row is not None else []
+
+    def prepare_views(self):
+        """Заранее строит все порядки и группы; удобно вызывать из фонового потока после загрузки.
+
+        Блокировка берётся на каждый порядок отдельно, чтобы не задерживать надолго интерфейс и сканер.
+        """
+        for order in SORT_ORDERS:
+            with self.lock:
+                self.views.order(order)
+        with self.lock:
+            self.views.artist_ids()
+
+    def remove(self, path):
+        """Удаляет трек из индекса"""
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM tracks WHERE path = ?', (path,))
+            self._forget(path)
+
+    def update_paths(self, paths):
+        """Точечно приводит индекс в соответствие с отдельными файлами, не перечитывая их каталоги.
+
+        Пропавшие файлы удаляются, новые и изменившиеся читаются заново,
+        нетронутые пропускаются. Возвращает списки (added, updated, removed)
+        путей треков, которые действительно изменились в индексе.
+        """
+        added, updated, removed = [], [], []
+        probed = []
+        gone = []
+        for path in dict.fromkeys(normalize_path(path) for path in paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            with self.lock:
+                row = self.db.execute('SELECT size, mtime, track_id, added FROM tracks WHERE path = ?',
+                                      (path,)).fetchone()
+                rejected = self.db.execute('SELECT size, mtime FROM rejected WHERE path = ?', (path,)).fetchone()
+            if st is None or not is_audio_name(path):
+                gone.append((path, row))
+                continue
+            key = (st.st_size, st.st_mtime)
+            if row is not None and row[:2] == key or row is None and rejected == key:
+                continue
+            meta, error = self._probe(path, st)
+            probed.append((path, st, row, meta, error))
+
+        with self.lock, self.db:
+            for path, row in gone:
+                self.db.execute('DELETE FROM tracks WHERE path = ?', (path,))
+                self.db.execute('DELETE FROM rejected WHERE path = ?', (path,))
+                if row is not None:
+                    self.moved_from[row[2]] = row[3]
+                    self._forget(path)
+                    removed.append(path)
+            for path, st, row, meta, error in probed:
+                if meta is None:
+                    self.db.execute('DELETE FROM tracks WHERE path = ?', (path,))
+                    self.db.execute('INSERT OR REPLACE INTO rejected (path, dir, size, mtime, reason) '
+                                    'VALUES (?, ?, ?, ?, ?)', (path, row_dir(path), st.st_size, st.st_mtime, error))
+                    if row is not None:
+                        self._forget(path)
+                        removed.append(path)
+                    continue
+                self.db.execute('DELETE FROM rejected WHERE path = ?', (path,))
+                if row is not None:
+                    meta.added = row[3]
+                else:
+                    self._inherit_added(meta)
+                self.db.execute(INSERT_TRACK, meta.as_row(row_dir(path)))
+                if row is not None and row[2] != meta.track_id:
+                    self.id_changes[row[2]] = meta.track_id
+                self._forget(path)
+                self._remember(meta)
+                (updated if row is not None else added).append(path)
+        return added, updated, removed
+
+    def dir_paths(self):
+        """Возвращает пути всех проиндексированных каталогов"""
+        with self.lock:
+            return [row[0] for row in self.db.execute('SELECT path FROM dirs')]
+
+    def stale_dirs(self):
+        """Возвращает проиндексированные каталоги, которых больше нет или mtime которых изменился.
+
+        Это один запрос и по os.stat на каталог, без чтения их содержимого,
+        поэтому проверку можно повторять периодически.
+        """
+        with self.lock:
+            known = self.db.execute('SELECT path, mtime FROM dirs').fetchall()
+        stale = []
+        for path, mtime in known:
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    stale.append(path)
+            except OSError:
+                stale.append(path)
+        return stale
+
+    def rescan(self, options, full=False, stats=None, **kwargs):
+        """Инкрементально обновляет индекс для корней сканирования и возвращает счётчики обхода.
+
+        Остальные параметры (workers, processes, commit_batch, progress) передаются в iter_rescan().
+        """
+        if stats is None:
+            stats = ScanStats()
+        for _ in self.iter_rescan(options, full, stats=stats, **kwargs):
+            pass
+        return stats
+
+    def rebase(self, old_root, new_root):
+        """Переносит индекс на другой корень, например с компьютера на телефон.
+
+        Размеры и mtime файлов остаются прежними, поэтому если файлы скопированы
+        с сохранением mtime, на новом месте теги заново читать не придётся.
+        """
+        with self.lock, self.db:
+            for table, columns in (('tracks', ('path', 'dir')), ('dirs', ('path', 'parent')),
+                                   ('rejected', ('path', 'dir'))):
+                for column in columns:
+                    rebase_column(self.db, table, column, old_root, new_root)
+            self._attach(TrackTable())
+            self.loose.clear()
+            self.complete = False
+
+    def counts(self):
+        """Сводка по индексу: число треков, каталогов и отброшенных файлов, общий размер и длительность"""
+        with self.lock:
+            tracks, size, duration = self.db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(duration), 0) FROM tracks').fetchone()
+            dirs = self.db.execute('SELECT COUNT(*) FROM dirs').fetchone()[0]
+            rejected = self.db.execute('SELECT COUNT(*) FROM rejected').fetchone()[0]
+        return {'tracks': tracks, 'dirs': dirs, 'rejected': rejected, 'bytes': size, 'duration': duration}
+
+    def iter_rescan(self, options, full=False, cancel=None, stats=None, workers=PROBE_WORKERS, processes=False,
+                    commit_batch=COMMIT_BATCH, progress=None):
+        """Инкрементально обновляет индекс и пачками отдаёт пути найденных треков.
+
+        Каталоги, mtime которых не изменился, не перечитываются: их файлы и
+        подкаталоги берутся из индекса, а сами файлы только сверяются по stat —
+        правка тегов на месте меняет mtime файла, но не каталога. Если файл
+        изменился, каталог перечитывается; теги и там читаются заново только у
+        файлов с новым размером или mtime. full=True перечитывает все каталоги.
+        Исключённые, скрытые и системные каталоги отсекаются до спуска в них.
+
+        Теги читаются в пуле из workers потоков (processes=True — процессов;
+        это имеет смысл вне приложения, где __main__ не тянет за собой Kivy).
+        Очередь заданий (пачек по PROBE_CHUNK файлов) ограничена, так что обход
+        каталогов не убегает далеко вперёд чтения. Прочитанные каталоги
+        записываются в индекс одной транзакцией примерно на commit_batch
+        файлов; каталог попадает в индекс только целиком, вместе со своим
+        mtime. progress(stats) вызывается после каждой порции результатов.
+
+        Если установлен threading.Event cancel, обход прерывается: незаписанные
+        каталоги будут перечитаны в следующий раз, а записи о непосещённых
+        каталогах остаются в индексе.
+        """
+        if stats is None:
+            stats = ScanStats()
+        with self.lock:
+            known_dirs = dict(self.db.execute('SELECT path, mtime FROM dirs'))
+        seen_dirs = set()
+        # Каталоги, которые не удалось открыть (носитель не смонтирован, нет прав): всё под ними остаётся в индексе
+        unreachable = []
+        stack = [(root, None, 0, None) for root in reversed(options.roots)]
+        executor = None
+        in_flight = {}
+        ready = []
+        ready_files = 0
+        max_in_flight = max(1, workers) * PROBE_QUEUE_PER_WORKER
+
+        def collect(block):
+            # Забирает готовые результаты пула; block=True ждёт хотя бы один
+            nonlocal ready_files
+            done, _ = wait(in_flight, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending = in_flight.pop(future)
+                results = future.result()
+                stats.tags_read += len(results)
+                for result in results:
+                    pending.add_result(*result)
+                if not pending.waiting:
+                    ready.append(pending)
+                    ready_files += len(pending.files)
+            if done and progress is not None:
+                progress(stats)
+
+        try:
+            while stack or in_flight or ready:
+                if cancel is not None and cancel.is_set():
+                    # Родители непосещённых каталогов уже могли попасть в индекс со свежим mtime —
+                    # сбрасываем его, иначе в следующий раз их подкаталоги не будут найдены
+                    unvisited = [parent for _, parent, _, _ in stack]
+                    unvisited += [pending.parent for pending in ready]
+                    unvisited += [pending.parent for pending in in_flight.values()]
+                    with self.lock, self.db:
+                        self.db.executemany('UPDATE dirs SET mtime = -1 WHERE path = ?',
+                                            [(path,) for path in set(unvisited) if path is not None])
+                    stats.finish(cancelled=True)
+                    return
+                if in_flight:
+                    collect(block=not stack or len(in_flight) >= max_in_flight)
+                if ready and (ready_files >= commit_batch or not stack and not in_flight):
+                    batch, ready, ready_files = ready, [], 0
+                    tracks = self._commit_dirs(batch, stats)
+                    stats.tracks_found += len(tracks)
+                    if tracks:
+                        yield tracks
+                if not stack or len(in_flight) >= max_in_flight:
+                    continue
+
+                dir_path, parent, depth, dir_mtime = stack.pop()
+                if dir_path in seen_dirs:
+                    continue
+                if dir_mtime is None:
+                    try:
+                        dir_mtime = os.stat(dir_path).st_mtime
+                    except OSError as e:
+                        print(f'Ошибка чтения каталога {dir_path}: {e}')
+                        unreachable.append(dir_path)
+                        continue
+                seen_dirs.add(dir_path)
+                stats.dirs_visited += 1
+                unchanged = not full and known_dirs.get(dir_path) == dir_mtime
+                if unchanged:
+                    with self.lock:
+                        children = [row[0] for row in self.db.execute('SELECT path FROM dirs WHERE parent = ?', (dir_path,))]
+                        stored = self.db.execute('SELECT path, size, mtime FROM tracks WHERE dir = ?',
+                                                 (dir_path,)).fetchall()
+                        rejected = self.db.execute('SELECT path, size, mtime FROM rejected WHERE dir = ?',
+                                                   (dir_path,)).fetchall()
+                    unchanged = all(_same_file(*row) for row in stored + rejected)
+                if unchanged:
+                    subdirs = [(child, None) for child in children]
+                    tracks = [row[0] for row in stored]
+                    stats.tracks_found += len(tracks)
+                    if tracks:
+                        yield tracks
+                else:
+                    subdirs, pending = self._list_dir(dir_path, parent, dir_mtime, stats)
+                    if pending is None:
+                        unreachable.append(dir_path)
+                    else:
+                        if executor is None and pending.jobs:
+                            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+                            executor = pool(max_workers=max(1, workers))
+                        # Файлы отдаются пачками: на каждое задание пула приходятся накладные расходы
+                        jobs = pending.jobs
+                        for start in range(0, len(jobs), PROBE_CHUNK):
+                            in_flight[executor.submit(probe_files, jobs[start:start + PROBE_CHUNK])] = pending
+                        pending.jobs = None
+                        if not pending.waiting:
+                            ready.append(pending)
+                            ready_files += len(pending.files)
+                for child, child_mtime in subdirs:
+                    if options.allows(child, depth + 1):
+                        stack.append((child, dir_path, depth + 1, child_mtime))
+                    else:
+                        stats.dirs_pruned += 1
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        # Обход завершён полностью: всё, что не встретилось, удалено или больше не входит в корни.
+        # Под неоткрывшимися каталогами обход просто не побывал — их содержимое не считается удалённым
+        removed = [path for path in known_dirs if path not in seen_dirs
+                   and not any(_is_under(path, root) for root in unreachable)]
+        with self.lock, self.db:
+            for path in removed:
+                for (track,) in self.db.execute('SELECT path FROM tracks WHERE dir = ?', (path,)).fetchall():
+                    self._forget(track)
+                self.db.execute('DELETE FROM tracks WHERE dir = ?', (path,))
+                self.db.execute('DELETE FROM rejected WHERE dir = ?', (path,))
+                self.db.execute('DELETE FROM dirs WHERE path = ?', (path,))
+            # Перенесённые за этот обход файлы уже нашлись на новом месте
+            self.moved_from.clear()
+        stats.finish()
+
+    def _list_dir(self, dir_path, parent, dir_mtime, stats):
+        """Перечитывает один каталог: возвращает подкаталоги (с mtime) и задания на чтение тегов"""
+        subdirs = []
+        files = {}
+        stats.dirs_listed += 1
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    stats.files_visited += 1
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            # stat() у DirEntry кэшируется, так что mtime подкаталога не потребует повторного os.stat
+                            subdirs.append((normalize_path(entry.path), entry.stat(follow_symlinks=False).st_mtime))
+                        elif is_audio_name(entry.name):
+                            files[normalize_path(entry.path)] = entry.stat()
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f'Ошибка чтения каталога {dir_path}: {e}')
+            return subdirs, None
+
+        pending = _PendingDir(dir_path, parent, dir_mtime, files)
+        with self.lock:
+            pending.stored = {path: (size, mtime, track_id, added) for path, size, mtime, track_id, added in
+                              self.db.execute('SELECT path, size, mtime, track_id, added FROM tracks WHERE dir = ?',
+                                              (dir_path,))}
+            pending.rejected = {path: (size, mtime) for path, size, mtime in
+                                self.db.execute('SELECT path, size, mtime FROM rejected WHERE dir = ?', (dir_path,))}
+        for path, st in files.items():
+            key = (st.st_size, st.st_mtime)
+            if pending.stored.get(path, ())[:2] == key:
+                continue
+            if pending.rejected.get(path) == key:
+                pending.skipped.add(path)
+                continue
+            pending.jobs.append((path, st.st_size, st.st_mtime))
+            pending.waiting.add(path)
+        stats.files_rejected += len(pending.skipped)
+        return subdirs, pending
+
+    def _commit_dirs(self, dirs, stats):
+        """Записывает прочитанные каталоги в индекс одной транзакцией и возвращает пути их треков"""
+        tracks = []
+        with self.lock, self.db:
+            for pending in dirs:
+                stored, rejected, failed, changed = pending.stored, pending.rejected, pending.failed, pending.changed
+                stats.files_rejected += len(failed)
+                for path in stored.keys() - pending.files.keys():
+                    # Файл мог переехать в каталог, который ещё не перечитан
+                    self.moved_from[stored[path][2]] = stored[path][3]
+                for path in (stored.keys() - pending.files.keys()) | (stored.keys() & failed.keys()):
+                    self.db.execute('DELETE FROM tracks WHERE path = ?', (path,))
+                    self._forget(path)
+                # Пропавшие файлы и те, что теперь читаются, больше не отброшены
+                for path in rejected.keys() - pending.skipped - failed.keys():
+                    self.db.execute('DELETE FROM rejected WHERE path = ?', (path,))
+                self.db.executemany('INSERT OR REPLACE INTO rejected (path, dir, size, mtime, reason) VALUES (?, ?, ?, ?, ?)',
+                                    failed.values())
+                for meta in changed:
+                    old = stored.get(meta.path)
+                    if old is None:
+                        self._inherit_added(meta)
+                    else:
+                        meta.added = old[3]
+                        if old[2] != meta.track_id:
+                            self.id_changes[old[2]] = meta.track_id
+                self.db.executemany(INSERT_TRACK, [meta.as_row(pending.path) for meta in changed])
+                for meta in changed:
+                    self._forget(meta.path)
+                    self._remember(meta)
+                    self.changed_paths.add(meta.path)
+                self.db.execute('INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)',
+                                (pending.path, pending.parent, pending.mtime))
+                tracks.extend(sorted(pending.files.keys() - pending.skipped - failed.keys()))
+        return tracks
+
+    @staticmethod
+    def _probe(path, st):
+        """Проверяет заголовок и читает теги; для не-аудио и битых файлов возвращает (None, причина)"""
+        path, size, mtime, fields, error = probe_file(path, st.st_size, st.st_mtime)
+        if fields is None:
+            print('Error:', error, 'Error file:', path)
+            return None, error
+        return TrackMeta(path, size, mtime, added=st.st_ctime, **fields), None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -1,101 +1,341 @@
+# perf импортируется первым: от него отсчитывается шкала запуска.
+# Виджеты диалогов и mutagen загружаются там, где нужны, а не при старте.
+from perf import startup, STARTUP_LOG, PROFILE_LOG, metrics, instrument_clock, record_frame
 import os
-import json
-from io import BytesIO
+import time
+import threading
+from collections import OrderedDict
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen, SlideTransition
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.core.audio import SoundLoader
-from kivy.uix.textinput import TextInput
-from kivy.uix.checkbox import CheckBox
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.label import Label
 from kivy.uix.image import Image
+from kivy.core.image import Image as CoreImage
 from kivy.uix.floatlayout import FloatLayout
-from kivy.uix.gridlayout import GridLayout
 from kivy.utils import platform
 from kivy.clock import Clock
-from kivy.graphics import Line, Color
-from kivy.uix.widget import Widget
-from kivy.uix.popup import Popup
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3
-
-EXTENSION = '.mp3'
+from kivy.graphics import Line, Color, Rectangle
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.textinput import TextInput
+from engine import LibraryEngine
+from scanner import LibraryScanner
+from covers import TextureCache
+from playqueue import PlayQueue, REPEAT_OFF, REPEAT_ONE
+from preload import SoundPreloader
+from search import SearchIndex
+from smart import make_definition
 
 if platform == 'android':
     DIRECTORY_PATH = '/storage/emulated/0/'
+    SCAN_ROOTS = [DIRECTORY_PATH + 'Music', DIRECTORY_PATH + 'Download']
 else:
     DIRECTORY_PATH = '.'
+    SCAN_ROOTS = [DIRECTORY_PATH]
+
+COVER_DISK_BYTES = 64 * 1024 * 1024
+COVER_TEXTURES = 16
+PLAYLIST_SCREENS = 3
+OVERLAY_INTERVAL = 0.5
+KEY_F12 = 293
+# Виды главного списка: папки — порядок путей, как в индексе; groups — исполнитель → альбом → треки
+LIST_VIEWS = (('folder', 'Папки'), ('title', 'Название'), ('artist', 'Исполнитель'), ('album', 'Альбом'),
+              ('added', 'Новые'), ('duration', 'Длительность'), ('groups', 'Исполнители'))
 
 music_files = []
-playlists = {}
+# Вся логика медиатеки и плейлистов — в engine; здесь только короткие имена для экранов
+engine = LibraryEngine(SCAN_ROOTS, max_cover_bytes=COVER_DISK_BYTES)
+playlist_store = engine.playlist_store
+playlists = engine.playlists
+smart_playlists = engine.smart
+library = engine.library
+scan_options = engine.scan_options
+scanner = LibraryScanner(library)
+cover_cache = engine.covers
+cover_textures = TextureCache(COVER_TEXTURES, lambda path: CoreImage(path).texture)
+instrument_clock(Clock)
+startup.mark('imports')
 
 def save_playlists():
-    """Сохраняет плейлисты в файл"""
-    try:
-        with open(os.path.join('.', 'playlists.json'), 'w', encoding='utf-8') as f:
-            json.dump(playlists, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print(f"Ошибка при сохранении плейлистов: {e}")
+    """Сразу записывает накопленные изменения плейлистов, не дожидаясь отложенной записи"""
+    playlist_store.flush()
 
 def load_playlists():
-    """Загружает плейлисты из файла"""
-    global playlists
-    try:
-        path = os.path.join('.', 'playlists.json')
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                playlists = json.load(f)
-    except Exception as e:
-        print(f"Ошибка при загрузке плейлистов: {e}")
-        playlists = {}
+    """Загружает плейлисты из файла и журнала изменений"""
+    engine.load_playlists()
 
-def refresh_music_files():
-    global music_files
+def link_playlists():
+    """Переводит пути в плейлистах старого формата на идентификаторы треков из индекса"""
+    return engine.link_playlists()
+
+def load_music_files():
+    """Загружает треки из индекса без обхода файловой системы и возвращает их пути"""
     try:
-        music_files = []
-        for path, _, files in os.walk(DIRECTORY_PATH):
-            if (('Download' in path) or ('Music' in path)) and platform == 'android':
-                music_files.extend(
-                    [os.path.join(path, file).replace('\\', '/') for file in files if str(file).endswith('.mp3')])
-            else:
-                music_files.extend(
-                    [os.path.join(path, file).replace('\\', '/') for file in files if str(file).endswith('.mp3')])
+        return engine.load_library()
     except Exception as e:
         print(f'Error: {e}')
+        return []
 
-load_playlists()
-refresh_music_files()
+def format_time(seconds):
+    seconds = max(0, int(seconds))
+    return f'{seconds // 60}:{seconds % 60:02d}'
 
 def delete_file(file_path):
     try:
-        os.remove(file_path)
-        refresh_music_files()
+        # Из индекса убирается только этот файл, остальная медиатека не перечитывается
+        engine.delete_file(file_path)
         return True
     except Exception as e:
         print(f'Ошибка удаления файла: {e}')
         return False
 
 
-def extract_cover_art(mp3_path, output_path=None):
-    """Извлекает обложку из MP3 и сохраняет её во временный файл."""
-    try:
-        audio = MP3(mp3_path, ID3=ID3)
-        if audio.tags is None:
-            return None
-
-        for tag in audio.tags.values():
-            if tag.FrameID == 'APIC':
-                cover_data = tag.data
-                if output_path:
-                    with open(output_path, 'wb') as f:
-                        f.write(cover_data)
-
-                return cover_data
-    except Exception as e:
-        print(f"Ошибка при извлечении обложки: {e}")
-    return None
+class TrackRow(RecycleDataViewBehavior, Button):
+    """Строка списка треков; RecycleView переиспользует её для разных треков"""
+
+    def __init__(self, **kwargs):
+        super(TrackRow, self).__init__(**kwargs)
+        self.path = None
+        self.group = None
+        self.index = None
+        self.list_view = None
+        self.font_size = '20sp'
+        self.halign = 'left'
+        self.background_color = (1, 1, 1, 0)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.list_view = rv
+        self.index = index
+        return super(TrackRow, self).refresh_view_attrs(rv, index, data)
+
+    def on_press(self):
+        if self.list_view and self.group is not None:
+            self.list_view.on_group(self.group)
+        elif self.list_view and self.path:
+            self.list_view.on_track(self.path, self.index)
+
+
+class TrackListView(RecycleView):
+    """Виртуализированный список треков: держит фиксированный набор строк и данные вида {'path', 'text', 'group'}.
+
+    Строка каждого трека строится один раз и лежит в row_index. order — треки
+    в порядке текущего вида, rows — то, что показывается без поиска: тот же
+    order или строки групп (у них path = None, а group передаётся в on_group).
+    В data попадают только строки, которые проходят фильтр поиска; при поиске
+    в группах ищется по всем трекам вида.
+    """
+
+    def __init__(self, on_track, on_group=None, **kwargs):
+        super(TrackListView, self).__init__(**kwargs)
+        self.on_track = on_track
+        self.on_group = on_group
+        self.viewclass = TrackRow
+        layout = RecycleBoxLayout(orientation='vertical',
+                                  default_size=(None, 150),
+                                  default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.rows = []
+        self.order = self.rows
+        self.row_index = {}
+        self.matched = None
+
+    @staticmethod
+    def make_row(path):
+        # group есть в каждой строке: RecycleView переиспользует виджеты и иначе оставил бы старое значение
+        return {'path': path, 'text': library.display_name(path) or os.path.basename(path), 'group': None}
+
+    def set_tracks(self, paths, rows=None):
+        self.rows = self.order = rows if rows is not None else [self.make_row(path) for path in paths]
+        self.row_index = {row['path']: row for row in self.rows}
+        self.show_rows()
+
+    def show_view(self, paths, groups=(), tracks=True):
+        """Показывает треки в порядке paths, переиспользуя уже построенные строки.
+
+        groups — строки групп над треками; с tracks=False показываются только они.
+        """
+        row_index = self.row_index
+        order = []
+        for path in paths:
+            row = row_index.get(path)
+            if row is None:
+                row = row_index[path] = self.make_row(path)
+            order.append(row)
+        self.order = order
+        if not groups:
+            self.rows = order
+        else:
+            self.rows = list(groups) + order if tracks else list(groups)
+        self.show_rows()
+
+    def append_tracks(self, paths):
+        rows = [self.make_row(path) for path in paths]
+        self.order.extend(rows)
+        self.row_index.update((row['path'], row) for row in rows)
+        if self.rows is not self.order:
+            return
+        if self.matched is None:
+            self.data.extend(rows)
+        else:
+            self.data.extend(row for row in rows if row['path'] in self.matched)
+
+    def update_track(self, path):
+        """Перерисовывает строку одного трека на месте, не трогая остальные"""
+        row = self.row_index.get(path)
+        if row is not None:
+            row.update(self.make_row(path))
+            self.refresh_from_data()
+
+    def remove_tracks(self, paths):
+        """Убирает строки треков из множества paths, не пересоздавая остальные"""
+        grouped = self.rows is not self.order
+        self.order = [row for row in self.order if row['path'] not in paths]
+        self.rows = [row for row in self.rows if row['path'] not in paths] if grouped else self.order
+        for path in paths:
+            self.row_index.pop(path, None)
+        self.show_rows()
+
+    def apply_filter(self, matched):
+        """Показывает только треки из множества matched; None снимает фильтр"""
+        self.matched = matched
+        self.show_rows()
+
+    def show_rows(self):
+        if self.matched is None:
+            self.data = self.rows
+        else:
+            matched = self.matched
+            self.data = [row for row in self.order if row['path'] in matched]
+
+
+class PickerRow(RecycleDataViewBehavior, BoxLayout):
+    """Строка выбора трека с флажком; состояние флажка берётся из набора выбранных треков"""
+
+    def __init__(self, **kwargs):
+        from kivy.uix.checkbox import CheckBox
+        super(PickerRow, self).__init__(**kwargs)
+        self.path = None
+        self.list_view = None
+        self.refreshing = False
+        self.label = Label()
+        self.checkbox = CheckBox(size_hint_x=None, width=150)
+        self.checkbox.bind(active=self.on_checkbox_active)
+        self.add_widget(self.label)
+        self.add_widget(self.checkbox)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.list_view = rv
+        result = super(PickerRow, self).refresh_view_attrs(rv, index, data)
+        self.refreshing = True
+        self.label.text = data['text']
+        self.checkbox.active = self.path in rv.selection
+        self.refreshing = False
+        return result
+
+    def on_checkbox_active(self, checkbox, active):
+        if not self.refreshing and self.list_view and self.path:
+            self.list_view.set_selected(self.path, active)
+
+
+class TrackPickerView(RecycleView):
+    """Виртуализированный выбор треков с фильтром; выбор хранится в множестве и переживает смену фильтра"""
+
+    def __init__(self, **kwargs):
+        super(TrackPickerView, self).__init__(**kwargs)
+        self.viewclass = PickerRow
+        layout = RecycleBoxLayout(orientation='vertical',
+                                  default_size=(None, 150),
+                                  default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter('height'))
+        self.add_widget(layout)
+        self.selection = set()
+        self.on_selection_changed = None
+        self.paths = []
+        self.rows = []
+        self.search_keys = []
+
+    def set_tracks(self, paths):
+        self.paths = list(paths)
+        self.rows = [TrackListView.make_row(path) for path in self.paths]
+        self.search_keys = [f"{row['text']} {row['path']}".casefold() for row in self.rows]
+        self.data = self.rows
+
+    def apply_filter(self, query):
+        query = query.strip().casefold()
+        if not query:
+            self.data = self.rows
+        else:
+            self.data = [row for row, key in zip(self.rows, self.search_keys) if query in key]
+
+    def set_selected(self, path, active):
+        if active:
+            self.selection.add(path)
+        else:
+            self.selection.discard(path)
+        self.notify_selection()
+
+    def select_all_matching(self):
+        self.selection.update(row['path'] for row in self.data)
+        self.notify_selection()
+
+    def invert_selection(self):
+        self.selection.symmetric_difference_update(row['path'] for row in self.data)
+        self.notify_selection()
+
+    def selected_paths(self):
+        """Возвращает выбранные треки в порядке медиатеки"""
+        return [path for path in self.paths if path in self.selection]
+
+    def notify_selection(self):
+        # Флажки видимых строк обновятся из множества при перерисовке — сами строки не перебираем
+        self.refresh_from_data()
+        if self.on_selection_changed:
+            self.on_selection_changed()
+
+
+class LazyScreenManager(ScreenManager):
+    """ScreenManager, который строит экраны при первом обращении.
+
+    register(name, factory) запоминает фабрику; экран создаётся в get_screen,
+    то есть при первом переходе на него или первом запросе из кода. Экраны
+    ищутся по имени в словаре, а не перебором списка.
+    """
+
+    def __init__(self, **kwargs):
+        self.factories = {}
+        self.by_name = {}
+        super(LazyScreenManager, self).__init__(**kwargs)
+
+    def register(self, name, factory):
+        self.factories[name] = factory
+
+    def add_widget(self, widget, *args, **kwargs):
+        super(LazyScreenManager, self).add_widget(widget, *args, **kwargs)
+        self.by_name[widget.name] = widget
+
+    def remove_widget(self, widget, *args, **kwargs):
+        super(LazyScreenManager, self).remove_widget(widget, *args, **kwargs)
+        if self.by_name.get(widget.name) is widget:
+            del self.by_name[widget.name]
+
+    def get_screen(self, name):
+        screen = self.by_name.get(name)
+        if screen is None:
+            if name not in self.factories:
+                return super(LazyScreenManager, self).get_screen(name)
+            screen = self.factories[name](name)
+            self.add_widget(screen)
+        return screen
+
+    def has_screen(self, name):
+        return name in self.by_name or name in self.factories
 
 
 class BaseScreen(Screen):
@@ -106,8 +346,6 @@ class BaseScreen(Screen):
         self.sound_on = False
         self.sound = None
         self.previous_name = None
-        self.current_position = 0
-        self.clock_event = None
 
         self.background_image = Image(source='wallpaper.jpg', allow_stretch=True, keep_ratio=False)
         layout.add_widget(self.background_image)
@@ -118,10 +356,6 @@ class BaseScreen(Screen):
         layout.add_widget(self.content)
         self.add_widget(layout)
 
-    def update_position(self, dt):
-        if self.sound and self.sound.state == 'play':
-            self.current_position += dt
-
 
 class InfoWin(BaseScreen):
     def __init__(self, **kwargs):
@@ -151,13 +385,13 @@ class InfoWin(BaseScreen):
 
 class UnitMusicWin(BaseScreen):
     def __init__(self, **kwargs):
+        from kivy.uix.slider import Slider
         super(UnitMusicWin, self).__init__(**kwargs)
         main_layout = FloatLayout()
 
         self.current_title = "Unknown Title"
         self.current_artist = "Unknown Artist"
-        self.update_event = None
-        self.current_playlist = None
+        self.dirty = True
 
         button_back = Button(text='<', size_hint=(None, None), size=(150, 150), pos_hint={'x': 0.02, 'top': 1},
                              font_size='30sp')
@@ -206,6 +440,33 @@ class UnitMusicWin(BaseScreen):
         button_next.bind(on_press=self.next_music)
         main_layout.add_widget(button_next)
 
+        self.button_shuffle = Button(text='S', size_hint=(None, None), size=(120, 150),
+                                     pos_hint={'x': 0.02, 'y': 0.10}, font_size='25sp')
+        self.button_shuffle.background_color = (1, 1, 1, 0)
+        self.button_shuffle.bind(on_press=self.toggle_shuffle)
+        main_layout.add_widget(self.button_shuffle)
+
+        self.button_repeat = Button(text='R', size_hint=(None, None), size=(120, 150),
+                                    pos_hint={'x': 0.86, 'y': 0.10}, font_size='25sp')
+        self.button_repeat.background_color = (1, 1, 1, 0)
+        self.button_repeat.bind(on_press=self.cycle_repeat)
+        main_layout.add_widget(self.button_repeat)
+
+        self.progress_event = None
+        self.seeking = False
+        self.progress = Slider(min=0, max=1, value=0, size_hint=(0.9, None), height=100,
+                               pos_hint={'center_x': 0.5, 'y': 0.22})
+        self.progress.bind(on_touch_down=self.on_progress_touch_down,
+                           on_touch_up=self.on_progress_touch_up)
+        main_layout.add_widget(self.progress)
+
+        self.elapsed_label = Label(text='0:00', size_hint=(None, None), size=(200, 60),
+                                   pos_hint={'x': 0.05, 'y': 0.19}, font_size='18sp')
+        main_layout.add_widget(self.elapsed_label)
+        self.remaining_label = Label(text='-0:00', size_hint=(None, None), size=(200, 60),
+                                     pos_hint={'right': 0.95, 'y': 0.19}, font_size='18sp')
+        main_layout.add_widget(self.remaining_label)
+
         with main_layout.canvas:
             Color(1, 1, 1, 1)
             Line(points=[0, 2000, 1080, 2000], width=5)
@@ -213,12 +474,16 @@ class UnitMusicWin(BaseScreen):
         self.content.add_widget(main_layout)
 
     def go_to_menu(self, button):
+        from kivy.uix.gridlayout import GridLayout
+        from kivy.uix.popup import Popup
         music_list = self.manager.get_screen('list')
         layout = GridLayout(cols=1, padding=10)
         close_button = Button(text="Назад")
         delete_button = Button(text="Удалить трек")
+        profile_button = Button(text="Профилирование: " + ("выкл" if metrics.enabled else "вкл"))
         layout.add_widget(close_button)
         layout.add_widget(delete_button)
+        layout.add_widget(profile_button)
 
         self.popup = Popup(title='Меню',
                            content=layout,
@@ -227,140 +492,154 @@ class UnitMusicWin(BaseScreen):
 
         close_button.bind(on_press=self.popup.dismiss)
         delete_button.bind(on_press=self.delete_current_track)
+        profile_button.bind(on_press=self.toggle_profiling)
+
+    def toggle_profiling(self, instance):
+        self.popup.dismiss()
+        App.get_running_app().toggle_profiling()
 
     def delete_current_track(self, instance):
         music_list = self.manager.get_screen('list')
-        if music_list.previous_name:
-            current_index = music_files.index(music_list.previous_name)
-
-            if delete_file(music_list.previous_name):
-                music_list.stop_music()
-
-                if len(music_files) > 0:
-                    new_index = current_index if current_index < len(music_files) else len(music_files) - 1
-                    if new_index >= 0:
-                        music_list.play_music(music_files[new_index])
-                        self.update_track_info()
-                    else:
-                        self.current_title = "No tracks"
-                        self.current_artist = ""
-                        self.label.text = f"{self.current_title}\n{self.current_artist}"
-                        self.track_img.source = 'default_pic.jpg'
-                        self.track_img.reload()
-                else:
-                    self.current_title = "No tracks"
-                    self.current_artist = ""
-                    self.label.text = f"{self.current_title}\n{self.current_artist}"
-                    self.track_img.source = 'default_pic.jpg'
-                    self.track_img.reload()
-
-                music_list.refresh_list()
-
-                for widget in self.walk():
-                    if isinstance(widget, Popup):
-                        widget.dismiss()
-                        break
-        save_playlists()
+        deleted = music_list.previous_name
+        if deleted and delete_file(deleted):
+            music_list.stop_music()
+            next_track = music_list.queue.remove_current()
+            if next_track:
+                music_list.load_track(next_track)
+            else:
+                self.current_title = "No tracks"
+                self.current_artist = ""
+                self.label.text = f"{self.current_title}\n{self.current_artist}"
+                self.show_cover(None)
+
+            music_list.apply_library_changes((), (), [deleted])
+            self.popup.dismiss()
 
     def back_to_list(self, instance):
-        if self.current_playlist:
-            playlist_screen = f'playlist_{self.current_playlist}'
-            self.manager.transition = SlideTransition(direction='right')
-            self.current_playlist = None
-            self.manager.current = playlist_screen
+        source = self.manager.get_screen('list').queue.source
+        self.manager.transition = SlideTransition(direction='right')
+        if source is not None and (source in playlists or source in smart_playlists):
+            self.manager.current = self.manager.get_screen('playlist').playlist_screen(source).name
         else:
-            self.manager.transition = SlideTransition(direction='right')
             self.manager.current = 'list'
 
     def prev_music(self, instance):
-        if self.current_playlist:
-            music_playlist = self.manager.get_screen(f'playlist_{self.current_playlist}')
-            print(music_playlist.previous_name)
-            music_list = self.manager.get_screen('list')
-            if music_playlist.previous_name and len(playlists[self.current_playlist]):
-                music_list.stop_music()
-                current_index = playlists[self.current_playlist].index(music_playlist.previous_name)
-                new_index = current_index - 1 if current_index > 0 else len(playlists[self.current_playlist]) - 1
-                music_playlist.previous_name = playlists[self.current_playlist][new_index]
-                music_list.play_music(playlists[self.current_playlist][new_index])
-                self.update_track_info()
-        else:
-            music_list = self.manager.get_screen('list')
-            if music_list.previous_name and len(music_files) > 0:
-                music_list.stop_music()
-                current_index = music_files.index(music_list.previous_name)
-                new_index = current_index - 1 if current_index > 0 else len(music_files) - 1
-                music_list.play_music(music_files[new_index])
-                self.update_track_info()
+        self.manager.get_screen('list').prev_track()
 
     def play_music(self, instance):
         music_list = self.manager.get_screen('list')
         if music_list.sound_on:
             music_list.pause_music()
-            self.button_play.text = '>'
         else:
             music_list.resume_music()
-            self.button_play.text = 'II'
 
     def next_music(self, instance):
-        if self.current_playlist:
-            music_playlist = self.manager.get_screen(f'playlist_{self.current_playlist}')
-            print(music_playlist.previous_name)
-            music_list = self.manager.get_screen('list')
-            if music_playlist.previous_name and len(playlists[self.current_playlist]) > 0:
-                music_list.stop_music()
-                current_index = playlists[self.current_playlist].index(music_playlist.previous_name)
-                new_index = current_index + 1 if current_index < (len(playlists[self.current_playlist]) - 1) else 0
-                music_playlist.previous_name = playlists[self.current_playlist][new_index]
-                music_list.play_music(playlists[self.current_playlist][new_index])
-                self.update_track_info()
-        else:
-            music_list = self.manager.get_screen('list')
-            if music_list.previous_name and len(music_files) > 0:
-                music_list.stop_music()
-                current_index = music_files.index(music_list.previous_name)
-                new_index = current_index + 1 if current_index < len(music_files) - 1 else 0
-                music_list.play_music(music_files[new_index])
-                self.update_track_info()
+        self.manager.get_screen('list').next_track()
+
+    def toggle_shuffle(self, instance):
+        queue = self.manager.get_screen('list').queue
+        queue.set_shuffle(not queue.shuffle)
+        self.manager.get_screen('list').prepare_next()
+        self.update_mode_buttons()
+
+    def cycle_repeat(self, instance):
+        self.manager.get_screen('list').queue.cycle_repeat()
+        self.manager.get_screen('list').prepare_next()
+        self.update_mode_buttons()
+
+    def update_mode_buttons(self):
+        queue = self.manager.get_screen('list').queue
+        self.button_shuffle.color = (1, 1, 1, 1 if queue.shuffle else 0.4)
+        self.button_repeat.text = 'R1' if queue.repeat == REPEAT_ONE else 'R'
+        self.button_repeat.color = (1, 1, 1, 0.4 if queue.repeat == REPEAT_OFF else 1)
 
     def on_pre_enter(self, *args):
-        self.update_track_info()
-        if not self.update_event:
-            self.update_event = Clock.schedule_interval(self.update_track_info, 1.5)
+        if self.dirty:
+            self.update_track_info()
+        self.update_progress()
+        self.update_mode_buttons()
+
+    def on_enter(self, *args):
+        self.start_progress()
 
     def on_leave(self, *args):
-        if self.update_event:
-            self.update_event.cancel()
-            self.update_event = None
+        self.stop_progress()
+
+    def on_track_changed(self, music_list, path):
+        """Перерисовывает экран сразу, если он виден, иначе — при следующем входе"""
+        self.dirty = True
+        if self.manager and self.manager.current == self.name:
+            self.update_track_info()
+
+    def on_play_state(self, music_list, playing):
+        self.button_play.text = 'II' if playing else '>'
+        self.update_progress()
+        if playing:
+            self.start_progress()
+        else:
+            self.stop_progress()
+
+    def start_progress(self):
+        """Обновляет полосу прогресса каждый кадр, но только пока экран виден и трек играет"""
+        if self.progress_event or not self.manager or self.manager.current != self.name:
+            return
+        if self.manager.get_screen('list').sound_on:
+            self.progress_event = Clock.schedule_interval(self.update_progress, 0)
+
+    def stop_progress(self):
+        if self.progress_event:
+            self.progress_event.cancel()
+            self.progress_event = None
+
+    def update_progress(self, *args):
+        if not self.manager or self.seeking:
+            return
+        music_list = self.manager.get_screen('list')
+        position = music_list.get_position()
+        duration = music_list.get_duration()
+        self.progress.max = max(duration, 1)
+        self.progress.value = min(position, self.progress.max)
+        self.elapsed_label.text = format_time(position)
+        self.remaining_label.text = '-' + format_time(duration - position)
+
+    def on_progress_touch_down(self, slider, touch):
+        if slider.collide_point(*touch.pos):
+            self.seeking = True
+
+    def on_progress_touch_up(self, slider, touch):
+        if self.seeking:
+            self.seeking = False
+            self.manager.get_screen('list').seek(slider.value)
+            self.update_progress()
 
     def update_track_info(self, *args):
         if self.manager:
+            self.dirty = False
             music_list = self.manager.get_screen('list')
-            if music_list.previous_name and len(music_files) > 0:
+            if music_list.previous_name and len(music_list.queue) > 0:
                 try:
-                    temp_cover_path = os.path.join('.', 'temp_cover.jpg')
-                    cover_data = extract_cover_art(music_list.previous_name, temp_cover_path)
-
-                    if cover_data:
-                        with open(temp_cover_path, 'wb') as f:
-                            f.write(cover_data)
-                        self.track_img.source = temp_cover_path
-                    else:
-                        self.track_img.source = 'default_pic.jpg'
-
-                    self.track_img.reload()
-
+                    meta = library.metadata(music_list.previous_name)
+                    if meta:
+                        self.current_title = meta.title
+                        self.current_artist = meta.artist
+                        self.label.text = f"{self.current_title}\n{self.current_artist}"
+                    self.show_cover(music_list.previous_name)
                     self.button_play.text = 'II' if music_list.sound_on else '>'
                 except Exception as e:
                     print(f"Ошибка при обновлении информации: {e}")
-                    self.track_img.source = 'default_pic.jpg'
-                    self.track_img.reload()
+                    self.show_cover(None)
             else:
                 self.current_title = "No tracks"
                 self.current_artist = ""
                 self.label.text = f"{self.current_title}\n{self.current_artist}"
-                self.track_img.source = 'default_pic.jpg'
-                self.track_img.reload()
+                self.show_cover(None)
+
+    def show_cover(self, track_path):
+        """Показывает обложку трека из кэша; без обложки — картинку по умолчанию"""
+        cover_path = cover_cache.cover_path(track_path) if track_path else None
+        texture = cover_textures.get(cover_path or 'default_pic.jpg')
+        if self.track_img.texture is not texture:
+            self.track_img.texture = texture
 
 
 class PlaylistScreen(Screen):
@@ -368,7 +647,10 @@ class PlaylistScreen(Screen):
         super(PlaylistScreen, self).__init__(**kwargs)
         self.playlist_name = playlist_name
         self.layout = FloatLayout()
-        self.previous_name = None
+        self.shown_tracks = []
+        self.entries = []
+        self.dirty = False
+        self.stale = False
 
         self.background_image = Image(source='wallpaper.jpg', allow_stretch=True, keep_ratio=False)
         self.layout.add_widget(self.background_image)
@@ -379,38 +661,51 @@ class PlaylistScreen(Screen):
         btn_back.bind(on_press=self.back_to_playlists)
         self.layout.add_widget(btn_back)
 
-        self.scroll = ScrollView(size_hint=(1, 0.8), pos_hint={'top': 0.9})
-        self.track_list = BoxLayout(orientation='vertical', size_hint_y=None)
-        self.track_list.bind(minimum_height=self.track_list.setter('height'))
-
+        self.track_view = TrackListView(on_track=lambda path, index: self.play_track(index),
+                                        size_hint=(1, 0.8), pos_hint={'top': 0.9})
         self.refresh_tracks()
-        self.scroll.add_widget(self.track_list)
-        self.layout.add_widget(self.scroll)
+        self.layout.add_widget(self.track_view)
 
         self.add_widget(self.layout)
 
     def refresh_tracks(self):
-        self.track_list.clear_widgets()
+        """Приводит список к плейлисту; если в конец только добавили треки, дописывает лишь их"""
+        if self.playlist_name in smart_playlists:
+            # Состав умного плейлиста индекс держит готовым; строки уже показанных треков переиспользуются
+            self.shown_tracks = library.smart_paths(self.playlist_name)
+            self.track_view.show_view(self.shown_tracks)
+            self.dirty = False
+            self.stale = False
+            return
+        entries = playlists.get(self.playlist_name, [])
+        if not self.stale and entries[:len(self.entries)] == self.entries:
+            added = [path for path in library.resolve(entries[len(self.entries):]) if path]
+            self.track_view.append_tracks(added)
+            self.shown_tracks.extend(added)
+        else:
+            self.shown_tracks = [path for path in library.resolve(entries) if path]
+            self.track_view.set_tracks(self.shown_tracks)
+        self.entries = list(entries)
+        self.dirty = False
+        self.stale = False
+
+    def on_queue_changed(self, music_list, playlist_name):
+        """Изменение медиатеки (None) может переместить файлы, поэтому плейлист разрешается заново целиком"""
+        if playlist_name is None:
+            self.stale = True
+        elif playlist_name != self.playlist_name:
+            return
+        if self.manager and self.manager.current == self.name:
+            self.refresh_tracks()
+        else:
+            self.dirty = True
 
-        if self.playlist_name in playlists:
-            for track_path in playlists[self.playlist_name]:
-                try:
-                    audio = MP3(track_path, ID3=ID3)
-                    title = str(audio.get("TIT2", "Unknown Title"))
-                    artist = str(audio.get("TPE1", "Unknown Artist"))
-
-                    btn = Button(text=f'{title} - {artist}', size_hint_y=None, height=150, font_size='20sp')
-                    btn.background_color = (1, 1, 1, 0)
-                    btn.bind(on_press=lambda x, path=track_path: self.play_track(path))
-                    self.track_list.add_widget(btn)
-                except:
-                    pass
-
-    def play_track(self, track_path):
-        self.previous_name = track_path
-        unit_screen = self.manager.get_screen('unit')
-        unit_screen.current_playlist = self.playlist_name
-        self.manager.get_screen('list').play_music(track_path)
+    def on_pre_enter(self, *args):
+        if self.dirty:
+            self.refresh_tracks()
+
+    def play_track(self, index):
+        self.manager.get_screen('list').play_from(self.shown_tracks, index, self.playlist_name)
         self.manager.transition = SlideTransition(direction='left')
         self.manager.current = 'unit'
 
@@ -449,18 +744,26 @@ class PlaylistWin(BaseScreen):
             Line(points=[0, 2000, 1080, 2000], width=5)
 
         self.content.add_widget(self.main_layout)
+        self.playlist_screens = OrderedDict()
 
     def refresh_playlists(self):
         self.playlist_list.clear_widgets()
 
-        for name in playlists:
+        for name in list(playlists) + list(smart_playlists):
             hbox = BoxLayout(size_hint_y=None, height=150)
+            smart = name in smart_playlists
 
-            btn = Button(text=name, font_size='20sp')
+            btn = Button(text=f'{name}  (авто)' if smart else name, font_size='20sp')
             btn.background_color = (1, 1, 1, 0)
             btn.bind(on_press=lambda x, n=name: self.open_playlist(n))
             hbox.add_widget(btn)
 
+            if smart:
+                btn_rules = Button(text='...', size_hint_x=None, width=150, font_size='20sp')
+                btn_rules.background_color = (1, 1, 1, 0)
+                btn_rules.bind(on_press=lambda x, n=name: self.show_smart_playlist_dialog(n))
+                hbox.add_widget(btn_rules)
+
             btn_del = Button(text='×', size_hint_x=None, width=150, font_size='20sp')
             btn_del.background_color = (1, 1, 1, 0)
             btn_del.bind(on_press=lambda x, n=name: self.delete_playlist(n))
@@ -469,6 +772,7 @@ class PlaylistWin(BaseScreen):
             self.playlist_list.add_widget(hbox)
 
     def delete_playlist(self, playlist_name):
+        from kivy.uix.popup import Popup
         content = BoxLayout(orientation='vertical', spacing=10)
         label = Label(text=f"Удалить плейлист '{playlist_name}'?")
         content.add_widget(label)
@@ -485,10 +789,11 @@ class PlaylistWin(BaseScreen):
                       size_hint=(0.7, 0.4))
 
         def do_delete(instance):
-            if playlist_name in playlists:
-                del playlists[playlist_name]
-                save_playlists()
+            if playlist_name in playlists or playlist_name in smart_playlists:
+                engine.delete_playlist(playlist_name)
+                self.close_playlist_screen(playlist_name)
                 self.refresh_playlists()
+                self.manager.get_screen('list').dispatch('on_queue_changed', playlist_name)
             popup.dismiss()
 
         btn_cancel.bind(on_press=popup.dismiss)
@@ -496,12 +801,35 @@ class PlaylistWin(BaseScreen):
         popup.open()
 
     def open_playlist(self, name):
-        if name not in self.manager.screen_names:
-            self.manager.add_widget(PlaylistScreen(playlist_name=name, name=f'playlist_{name}'))
+        screen = self.playlist_screen(name)
         self.manager.transition = SlideTransition(direction='up')
-        self.manager.current = f'playlist_{name}'
+        self.manager.current = screen.name
+
+    def playlist_screen(self, name):
+        """Возвращает экран плейлиста из LRU на PLAYLIST_SCREENS экранов, вытесняя давно открытые"""
+        screen = self.playlist_screens.get(name)
+        if screen is not None:
+            self.playlist_screens.move_to_end(name)
+            return screen
+        screen = PlaylistScreen(playlist_name=name, name=f'playlist_{name}')
+        self.manager.get_screen('list').bind(on_queue_changed=screen.on_queue_changed)
+        self.manager.add_widget(screen)
+        self.playlist_screens[name] = screen
+        # Экран, который сейчас показан или участвует в переходе, имеет родителя — его не трогаем
+        for old_name in [old for old, old_screen in self.playlist_screens.items() if old_screen.parent is None]:
+            if len(self.playlist_screens) <= PLAYLIST_SCREENS:
+                break
+            self.close_playlist_screen(old_name)
+        return screen
+
+    def close_playlist_screen(self, name):
+        screen = self.playlist_screens.pop(name, None)
+        if screen is not None:
+            self.manager.get_screen('list').unbind(on_queue_changed=screen.on_queue_changed)
+            self.manager.remove_widget(screen)
 
     def show_add_playlist_dialog(self, instance):
+        from kivy.uix.popup import Popup
         content = BoxLayout(orientation='vertical', spacing=10)
 
         input_name = TextInput(hint_text='Название плейлиста', size_hint_y=None, height=150)
@@ -510,8 +838,10 @@ class PlaylistWin(BaseScreen):
         btn_box = BoxLayout(size_hint_y=None, height=100)
         btn_cancel = Button(text='Отмена')
         btn_create = Button(text='Создать')
+        btn_smart = Button(text='Умный')
         btn_box.add_widget(btn_cancel)
         btn_box.add_widget(btn_create)
+        btn_box.add_widget(btn_smart)
         content.add_widget(btn_box)
 
         popup = Popup(title='Новый плейлист', content=content,
@@ -519,52 +849,114 @@ class PlaylistWin(BaseScreen):
 
         def create_playlist(inst):
             name = input_name.text.strip()
-            if name and name not in playlists:
-                playlists[name] = []
-                save_playlists()
+            if name and name not in playlists and name not in smart_playlists:
+                playlist_store.create(name)
                 self.refresh_playlists()
                 self.show_add_tracks_dialog(name)
             popup.dismiss()
 
+        def create_smart(inst):
+            name = input_name.text.strip()
+            if name and name not in playlists and name not in smart_playlists:
+                self.show_smart_playlist_dialog(name)
+            popup.dismiss()
+
         btn_cancel.bind(on_press=popup.dismiss)
         btn_create.bind(on_press=create_playlist)
+        btn_smart.bind(on_press=create_smart)
         popup.open()
 
-    def show_add_tracks_dialog(self, playlist_name):
+    def show_smart_playlist_dialog(self, playlist_name):
+        """Правила умного плейлиста: пустые поля не участвуют; для уже существующего поля заполнены его правилами"""
+        from kivy.uix.popup import Popup
+        from kivy.uix.checkbox import CheckBox
+        from kivy.uix.gridlayout import GridLayout
+        values = {}
+        definition = smart_playlists.get(playlist_name, {})
+        for rule in definition.get('rules', ()):
+            field = rule.get('field')
+            if field in ('artist', 'album', 'title'):
+                values[field] = rule.get('contains', '')
+            elif field == 'duration':
+                values['min'] = '' if rule.get('min') is None else f"{rule['min'] / 60:g}"
+                values['max'] = '' if rule.get('max') is None else f"{rule['max'] / 60:g}"
+            elif field == 'folder':
+                values['folder'] = rule.get('prefix', '')
+            elif field == 'added':
+                values['days'] = f"{rule.get('days', 0):g}"
+            elif field == 'played':
+                values['never'] = rule.get('never', True)
+
         content = BoxLayout(orientation='vertical', spacing=10)
+        form = GridLayout(cols=2, spacing=10)
+        inputs = {}
+        for key, label in (('artist', 'Исполнитель содержит'), ('album', 'Альбом содержит'),
+                           ('title', 'Название содержит'), ('min', 'Не короче, мин'), ('max', 'Не длиннее, мин'),
+                           ('folder', 'Из папки'), ('days', 'Добавлен за дней')):
+            form.add_widget(Label(text=label))
+            inputs[key] = TextInput(text=values.get(key, ''), multiline=False)
+            form.add_widget(inputs[key])
+        form.add_widget(Label(text='Ни разу не проигрывался'))
+        never_played = CheckBox(active=bool(values.get('never')))
+        form.add_widget(never_played)
+        form.add_widget(Label(text='Достаточно одного правила'))
+        match_any = CheckBox(active=definition.get('match') == 'any')
+        form.add_widget(match_any)
+        content.add_widget(form)
+
+        error_label = Label(size_hint_y=None, height=50)
+        content.add_widget(error_label)
+        btn_box = BoxLayout(size_hint_y=None, height=100)
+        btn_cancel = Button(text='Отмена')
+        btn_save = Button(text='Сохранить')
+        btn_box.add_widget(btn_cancel)
+        btn_box.add_widget(btn_save)
+        content.add_widget(btn_box)
 
-        scroll = ScrollView()
-        track_list = BoxLayout(orientation='vertical', size_hint_y=None)
-        track_list.bind(minimum_height=track_list.setter('height'))
+        popup = Popup(title=f'Умный плейлист "{playlist_name}"', content=content, size_hint=(0.9, 0.8))
 
-        selected_tracks = []
+        def number(key, scale=1):
+            text = inputs[key].text.strip().replace(',', '.')
+            return float(text) * scale if text else None
 
-        for track_path in music_files:
+        def save(inst):
             try:
-                audio = MP3(track_path, ID3=ID3)
-                title = str(audio.get("TIT2", "Unknown Title"))
-                artist = str(audio.get("TPE1", "Unknown Artist"))
-
-                hbox = BoxLayout(size_hint_y=None, height=150)
-                cb = CheckBox(size_hint_x=None, width=150)
-                lbl = Label(text=f'{title} - {artist}')
-                print(f'{title} - {artist}')
-                hbox.add_widget(lbl)
-                hbox.add_widget(cb)
-                track_list.add_widget(hbox)
-
-                def on_checkbox_active(checkbox, active, path=track_path):
-                    if active:
-                        selected_tracks.append(path)
-                    elif path in selected_tracks:
-                        selected_tracks.remove(path)
-
-                cb.bind(active=on_checkbox_active)
-            except Exception as e:
-                print(f'Не удалось найти треки: {e}')
-
-        scroll.add_widget(track_list)
-        content.add_widget(scroll)
+                new_definition = make_definition(
+                    'any' if match_any.active else 'all',
+                    inputs['artist'].text.strip(), inputs['album'].text.strip(), inputs['title'].text.strip(),
+                    number('min', 60), number('max', 60), inputs['folder'].text.strip(), number('days'),
+                    never_played.active)
+            except ValueError:
+                error_label.text = 'Длительность и дни — числа'
+                return
+            engine.define_smart(playlist_name, new_definition)
+            popup.dismiss()
+            self.refresh_playlists()
+            self.manager.get_screen('list').dispatch('on_queue_changed', playlist_name)
+
+        btn_cancel.bind(on_press=popup.dismiss)
+        btn_save.bind(on_press=save)
+        popup.open()
+
+    def show_add_tracks_dialog(self, playlist_name):
+        from kivy.uix.popup import Popup
+        content = BoxLayout(orientation='vertical', spacing=10)
+
+        search_input = TextInput(hint_text='Поиск', size_hint_y=None, height=120, multiline=False)
+        content.add_widget(search_input)
+
+        picker = TrackPickerView()
+        picker.set_tracks(music_files)
+        content.add_widget(picker)
+
+        bulk_box = BoxLayout(size_hint_y=None, height=50)
+        btn_select_all = Button(text='Выбрать найденные')
+        btn_invert = Button(text='Инвертировать')
+        selected_label = Label(text='Выбрано: 0')
+        bulk_box.add_widget(btn_select_all)
+        bulk_box.add_widget(btn_invert)
+        bulk_box.add_widget(selected_label)
+        content.add_widget(bulk_box)
 
         btn_box = BoxLayout(size_hint_y=None, height=50)
         btn_cancel = Button(text='Отмена')
@@ -576,12 +968,20 @@ class PlaylistWin(BaseScreen):
         popup = Popup(title=f'Добавить треки в "{playlist_name}"',
                       content=content, size_hint=(0.9, 0.8))
 
+        apply_filter = Clock.create_trigger(lambda dt: picker.apply_filter(search_input.text), 0.1)
+        search_input.bind(text=lambda instance, text: apply_filter())
+        picker.on_selection_changed = lambda: setattr(selected_label, 'text', f'Выбрано: {len(picker.selection)}')
+
         def save_tracks(inst):
-            playlists[playlist_name].extend(selected_tracks)
-            save_playlists()
+            paths = picker.selected_paths()
+            ids = library.track_ids(paths)
+            playlist_store.add_tracks(playlist_name, [ids.get(path, path) for path in paths])
             popup.dismiss()
             self.refresh_playlists()
+            self.manager.get_screen('list').dispatch('on_queue_changed', playlist_name)
 
+        btn_select_all.bind(on_press=lambda inst: picker.select_all_matching())
+        btn_invert.bind(on_press=lambda inst: picker.invert_selection())
         btn_cancel.bind(on_press=popup.dismiss)
         btn_save.bind(on_press=save_tracks)
         popup.open()
@@ -592,8 +992,26 @@ class PlaylistWin(BaseScreen):
 
 
 class MusicList(BaseScreen):
+    """Главный список треков; он же владеет плеером и рассылает события воспроизведения.
+
+    События: on_track_changed(path), on_play_state(playing), on_track_ended(path)
+    и on_queue_changed(playlist_name), где None означает всю медиатеку.
+    """
+
     def __init__(self, **kwargs):
+        self.register_event_type('on_track_changed')
+        self.register_event_type('on_play_state')
+        self.register_event_type('on_track_ended')
+        self.register_event_type('on_queue_changed')
         super(MusicList, self).__init__(**kwargs)
+        self.ignored_stop = None
+        self.paused_position = 0
+        self.queue = PlayQueue()
+        self.preloader = SoundPreloader(metrics.timed('sound_load')(SoundLoader.load),
+                                        lambda fn: Clock.schedule_once(lambda dt: fn()),
+                                        self.release_sound)
+        self.pending_track = None
+        self.ended_at = None
         self.main_layout = FloatLayout()
 
         self.label = Label(text=f"Песен: {len(music_files)}",
@@ -615,15 +1033,33 @@ class MusicList(BaseScreen):
         playlist_button.background_color = (1, 1, 1, 0)
         playlist_button.bind(on_press=self.go_to_playlist)
 
-        self.layout_music = BoxLayout(orientation='vertical', size_hint_y=None)
-        self.layout_music.bind(minimum_height=self.layout_music.setter('height'))
-        self.scroll_view = ScrollView(size_hint=(1, 0.7), size=(400, 300))
+        self.view = 'folder'
+        self.group = ()
+        self.view_button = Button(text=dict(LIST_VIEWS)[self.view], size_hint=(None, None), size=(400, 150),
+                                  pos_hint={'right': 0.98, 'top': 1}, font_size='25sp')
+        self.view_button.background_color = (1, 1, 1, 0)
+        self.view_button.bind(on_press=self.choose_view)
+
+        self.track_view = TrackListView(on_track=self.play_from_list, on_group=self.open_group, size_hint=(1, 0.7))
+        self.scan_progress = None
+        self.watcher = None
+        self.check_event = None
+
+        self.search_index = None
+        self.search_building = False
+        self.search_input = TextInput(hint_text='Поиск', multiline=False, size_hint=(0.55, None), height=100,
+                                      pos_hint={'x': 0.4, 'y': 0.705}, font_size='20sp')
+        self.search_trigger = Clock.create_trigger(self.apply_search, 0)
+        self.search_input.bind(text=lambda instance, text: self.search_trigger(),
+                               focus=self.on_search_focus)
 
         self.main_layout.add_widget(settings_button)
+        self.main_layout.add_widget(self.view_button)
         self.main_layout.add_widget(self.label)
+        self.main_layout.add_widget(self.search_input)
         self.main_layout.add_widget(music_button)
         self.main_layout.add_widget(playlist_button)
-        self.main_layout.add_widget(self.scroll_view)
+        self.main_layout.add_widget(self.track_view)
 
         with self.main_layout.canvas:
             Color(1, 1, 1, 1)
@@ -636,30 +1072,247 @@ class MusicList(BaseScreen):
 
         self.refresh_list()
 
-    def refresh_list(self):
-        """Обновляет список песен в ScrollView"""
-        self.layout_music.clear_widgets()
+    @metrics.timed('refresh_list')
+    def refresh_list(self, rows=None):
+        """Обновляет список песен в RecycleView; rows — уже построенные строки для music_files"""
+        self.known_files = set(music_files)
+        self.track_view.set_tracks(music_files, rows)
+        if self.view != 'folder':
+            self.apply_view()
+        self.sync_search_index()
+        self.update_count()
+        self.dispatch('on_queue_changed', None)
+
+    def load_library(self, on_loaded=None):
+        """Читает индекс и строит строки списка в фоновом потоке, а показывает их одним присваиванием.
+
+        Так время до первого кадра не зависит от размера медиатеки: экран
+        показывается с пустым списком, а треки появляются, когда готовы.
+        on_loaded вызывается, когда в списке весь индекс.
+        """
+        def load():
+            paths = load_music_files()
+            rows = [TrackListView.make_row(path) for path in paths]
+            changed = link_playlists()
+            Clock.schedule_once(lambda dt: self.show_library(paths, rows, changed, on_loaded))
+
+        threading.Thread(target=load, daemon=True).start()
+
+    def show_library(self, paths, rows, changed=(), on_loaded=None):
+        startup.mark('index')
+        music_files[:] = paths
+        self.refresh_list(rows)
+        for name in changed:
+            self.dispatch('on_queue_changed', name)
+        if on_loaded is not None:
+            on_loaded()
+
+    def start_scan(self, full=False):
+        """Запускает фоновое сканирование медиатеки; найденные треки добавляются в список по мере обхода"""
+        scanner.on_batch = lambda paths: Clock.schedule_once(lambda dt: self.add_tracks(paths))
+        scanner.on_done = lambda stats: Clock.schedule_once(lambda dt: self.on_scan_done(stats))
+        scanner.on_progress = lambda stats: Clock.schedule_once(lambda dt: self.show_scan_progress(stats))
+        scanner.start(scan_options, full)
+
+    def show_scan_progress(self, stats):
+        """Показывает, сколько файлов уже прочитал сканер; вызывается не чаще нескольких раз в секунду"""
+        if not stats.elapsed:
+            self.scan_progress = stats.tags_read
+            self.update_count()
+
+    def add_tracks(self, paths):
+        """Добавляет в список треки из очередной пачки сканера"""
+        new_paths = [path for path in paths if path not in self.known_files]
+        if not new_paths:
+            return
+        music_files.extend(new_paths)
+        self.known_files.update(new_paths)
+        self.track_view.append_tracks(new_paths)
+        if self.view != 'folder':
+            self.apply_view()
+        self.sync_search_index(new_paths)
+        self.update_count()
+        self.dispatch('on_queue_changed', None)
+
+    def apply_library_changes(self, added, updated, removed):
+        """Точечно применяет изменения отдельных треков к списку, очереди, поиску и плейлистам"""
+        if removed:
+            gone = set(removed)
+            music_files[:] = [path for path in music_files if path not in gone]
+            self.known_files -= gone
+            self.track_view.remove_tracks(gone)
+            # Играющий трек доигрывает из памяти; из очереди он уйдёт при переходе
+            self.queue.remove_tracks(gone - {self.queue.current()})
+            if self.search_index is not None:
+                for path in removed:
+                    self.search_index.remove(path)
+        for path in updated:
+            self.track_view.update_track(path)
+        if updated and self.view != 'folder':
+            # Изменённые теги могли сдвинуть трек в сортировке или перенести его в другую группу
+            self.apply_view()
+        self.sync_search_index(updated)
+        if added:
+            self.add_tracks(added)
+        elif removed or updated:
+            self.update_count()
+            self.dispatch('on_queue_changed', None)
+        for name in engine.sync_playlists(link=False):
+            self.dispatch('on_queue_changed', name)
+
+    def start_watching(self):
+        """После первого полного обхода включает слежение за медиатекой: inotify или периодическую сверку mtime"""
+        if self.watcher is not None or self.check_event is not None:
+            return
+        if scan_options.watch:
+            from watcher import LibraryWatcher
+            watcher = LibraryWatcher(
+                library, scan_options,
+                on_changes=lambda *changes: Clock.schedule_once(lambda dt: self.apply_library_changes(*changes)),
+                on_dirs_changed=lambda: Clock.schedule_once(lambda dt: self.start_scan()))
+            if watcher.start(library.dir_paths()):
+                self.watcher = watcher
+                return
+        if scan_options.check_interval:
+            self.check_event = Clock.schedule_interval(lambda dt: scanner.check(), scan_options.check_interval)
+
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        if self.check_event is not None:
+            self.check_event.cancel()
+            self.check_event = None
+
+    def on_scan_done(self, stats):
+        """После полного обхода убирает из списка пропавшие файлы и приводит порядок к индексу"""
+        print(f'Сканирование: {stats}')
+        self.scan_progress = None
+        self.update_count()
+        changed = engine.sync_playlists(link=not stats.cancelled)
+        if not stats.cancelled:
+            paths = library.paths()
+            if paths != music_files:
+                # refresh_list шлёт on_queue_changed(None): открытые плейлисты заново найдут переехавшие файлы
+                music_files[:] = paths
+                self.refresh_list()
+            # Теги могли поменяться и без смены путей; переиндексируются только перечитанные треки
+            self.sync_search_index(library.take_changed_paths() & self.known_files)
+            self.start_watching()
+        for name in changed:
+            self.dispatch('on_queue_changed', name)
+
+    def choose_view(self, instance):
+        from kivy.uix.gridlayout import GridLayout
+        from kivy.uix.popup import Popup
+        layout = GridLayout(cols=1, padding=10)
+        popup = Popup(title='Вид списка', content=layout, size_hint=(None, None), size=(700, 1100))
+        for name, title in LIST_VIEWS:
+            button = Button(text=title)
+            button.bind(on_press=lambda inst, name=name: self.set_view(name, popup))
+            layout.add_widget(button)
+        popup.open()
 
-        for sound_name in music_files:
-            try:
-                audio = MP3(sound_name, ID3=ID3)
-                title = str(audio.get("TIT2", "Unknown Title"))
-                artist = str(audio.get("TPE1", "Unknown Artist"))
-
-                play_button = Button(text=f'{title} - {artist}',
-                                     size_hint=(1, None),
-                                     height=150,
-                                     font_size='20sp',
-                                     halign='left')
-                play_button.background_color = (1, 1, 1, 0)
-                play_button.bind(on_press=lambda instance, file=sound_name: self.play_music(file))
-                self.layout_music.add_widget(play_button)
-            except Exception as e:
-                print('Error:', e, 'Error file:', sound_name)
-
-        self.scroll_view.clear_widgets()
-        self.scroll_view.add_widget(self.layout_music)
-        self.label.text = f"Песен: {len(music_files)}"
+    def set_view(self, name, popup=None):
+        if popup is not None:
+            popup.dismiss()
+        self.view = name
+        self.group = ()
+        self.view_button.text = dict(LIST_VIEWS)[name]
+        self.apply_view()
+
+    def open_group(self, group):
+        """Переход по группам: () — исполнители, (artist,) — альбомы исполнителя, (artist, album) — треки альбома"""
+        self.group = group
+        self.apply_view()
+
+    @metrics.timed('apply_view')
+    def apply_view(self):
+        """Показывает список в текущем виде. Порядки и группы индекс держит готовыми,
+        поэтому здесь нет ни сортировки, ни чтения тегов — только выборка уже построенных строк.
+        """
+        view, group = self.view, self.group
+        if view == 'folder':
+            self.track_view.show_view(music_files)
+        elif view != 'groups':
+            self.track_view.show_view(library.sorted_paths(view, reverse=view == 'added'))
+        elif not group:
+            rows = [{'path': None, 'text': f'{name or "Без исполнителя"}  (альбомов: {albums}, треков: {tracks})',
+                     'group': (artist,)} for artist, name, albums, tracks in library.artists()]
+            # При поиске на уровне групп ищется по всей медиатеке в порядке исполнителей
+            self.track_view.show_view(library.sorted_paths('artist'), rows, tracks=False)
+        else:
+            back = {'path': None, 'text': '..', 'group': group[:-1]}
+            if len(group) == 1:
+                rows = [back] + [{'path': None, 'text': f'{name or "Без альбома"}  ({count})',
+                                  'group': (group[0], album)} for album, name, count in library.albums(group[0])]
+                self.track_view.show_view(library.group_paths(group[0]), rows, tracks=False)
+            else:
+                self.track_view.show_view(library.group_paths(*group), [back])
+        self.update_count()
+
+    def update_count(self):
+        matched = self.track_view.matched
+        self.label.text = f"Песен: {len(music_files)}" if matched is None else f"Найдено: {len(self.track_view.data)}"
+        if self.scan_progress is not None:
+            self.label.text += f" (прочитано файлов: {self.scan_progress})"
+
+    @staticmethod
+    def search_fields(path):
+        meta = library.metadata(path)
+        return (meta.title, meta.artist, meta.album) if meta else (os.path.basename(path),)
+
+    def on_search_focus(self, instance, focused):
+        if focused:
+            self.build_search_index()
+
+    def build_search_index(self):
+        """Строит поисковый индекс по кэшу метаданных в фоновом потоке, чтобы не задерживать кадры"""
+        if self.search_index is not None or self.search_building:
+            return
+        self.search_building = True
+        paths = list(music_files)
+
+        def build():
+            index = SearchIndex()
+            for path in paths:
+                index.add(path, *self.search_fields(path))
+            Clock.schedule_once(lambda dt: self.on_search_index_built(index))
+
+        threading.Thread(target=build, daemon=True).start()
+
+    def on_search_index_built(self, index):
+        self.search_index = index
+        self.search_building = False
+        # Пока индекс строился, сканер мог добавить или убрать треки
+        self.sync_search_index()
+        self.apply_search()
+
+    def sync_search_index(self, paths=None):
+        """Обновляет поисковый индекс по месту: paths переиндексируются, а без paths
+        добавляются недостающие треки и убираются пропавшие. Затем запрос применяется заново.
+        """
+        index = self.search_index
+        if index is None:
+            return
+        if paths is None:
+            for path in [path for path in index.docs if path not in self.known_files]:
+                index.remove(path)
+            paths = [path for path in music_files if path not in index.docs]
+        for path in paths:
+            index.add(path, *self.search_fields(path))
+        if self.track_view.matched is not None:
+            self.search_trigger()
+
+    def apply_search(self, *args):
+        """Фильтрует список по запросу; строки берутся из уже построенных данных списка"""
+        query = self.search_input.text
+        if self.search_index is None:
+            if query.strip():
+                self.build_search_index()
+            return
+        self.track_view.apply_filter(self.search_index.search(query))
+        self.update_count()
 
     def go_to_info(self, instance):
         self.manager.transition = SlideTransition(direction='right')
@@ -674,60 +1327,276 @@ class MusicList(BaseScreen):
             self.manager.transition = SlideTransition(direction='left')
             self.manager.current = 'unit'
 
+    def on_track_changed(self, path):
+        pass
+
+    def on_play_state(self, playing):
+        pass
+
+    def on_track_ended(self, path):
+        pass
+
+    def on_queue_changed(self, playlist_name):
+        pass
+
+    def on_sound_stop(self, sound):
+        # Sound шлёт on_stop и при ручной остановке; концом трека считаем только остальные случаи
+        if sound is not self.sound or sound is self.ignored_stop or sound.state == 'play':
+            return
+        self.sound_on = False
+        self.paused_position = 0
+        self.dispatch('on_play_state', False)
+        self.dispatch('on_track_ended', self.previous_name)
+        self.ended_at = time.perf_counter()
+        self.next_track(auto=True)
+
+    def halt_sound(self):
+        self.ignored_stop = self.sound
+        self.sound.stop()
+        self.sound_on = False
+        self.dispatch('on_play_state', False)
+
+    def get_position(self):
+        """Текущая позиция в секундах по данным звукового движка"""
+        if self.sound and self.sound_on:
+            return self.sound.get_pos()
+        return self.paused_position
+
+    def get_duration(self):
+        if self.sound and self.sound.length > 0:
+            return self.sound.length
+        meta = library.metadata(self.previous_name) if self.previous_name else None
+        return meta.duration if meta else 0
+
+    def seek(self, position):
+        position = max(0, min(position, self.get_duration()))
+        if self.sound and self.sound_on:
+            self.sound.seek(position)
+        else:
+            self.paused_position = position
+
     def stop_music(self):
         if self.sound:
-            if self.clock_event:
-                self.clock_event.cancel()
-            self.sound.stop()
-            self.sound_on = False
-            self.current_position = 0
+            self.halt_sound()
+            self.paused_position = 0
 
     def pause_music(self):
         if self.sound and self.sound_on:
-            if self.clock_event:
-                self.clock_event.cancel()
-            self.sound.stop()
-            self.sound_on = False
+            # Kivy не умеет паузу: останавливаем звук и запоминаем позицию, чтобы продолжить с неё
+            self.paused_position = self.sound.get_pos()
+            self.halt_sound()
 
     def resume_music(self):
         if self.sound and not self.sound_on:
+            self.ignored_stop = None
             self.sound.play()
+            if self.paused_position:
+                self.sound.seek(self.paused_position)
             self.sound_on = True
-            self.clock_event = Clock.schedule_interval(self.update_position, 0.1)
+            self.dispatch('on_play_state', True)
             self.manager.transition = SlideTransition(direction='left')
             self.manager.current = 'unit'
 
-    def play_music(self, name):
-        try:
-            if self.previous_name != name:
-                self.stop_music()
-                self.sound = SoundLoader.load(name)
-                if self.sound:
-                    self.sound.play()
-                    self.sound_on = True
-                    self.previous_name = name
-                    self.clock_event = Clock.schedule_interval(self.update_position, 0.1)
-                    self.manager.transition = SlideTransition(direction='left')
-                    self.manager.current = 'unit'
+    def play_from_list(self, path, index):
+        # В группах среди строк есть и сами группы; в очередь идут только треки
+        tracks = [row['path'] for row in self.track_view.data if row['path']]
+        self.play_from(tracks, tracks.index(path))
+
+    def play_from(self, tracks, index, source=None):
+        """Строит очередь из tracks и играет трек index; повторное нажатие на текущий трек — пауза"""
+        if tracks[index] == self.previous_name and source == self.queue.source:
+            if self.sound_on:
+                self.pause_music()
             else:
-                if self.sound_on:
-                    self.pause_music()
-                else:
-                    self.resume_music()
+                self.resume_music()
+            return
+        self.queue = PlayQueue(tracks, index, source, shuffle=self.queue.shuffle, repeat=self.queue.repeat)
+        self.load_track(self.queue.current())
+
+    def next_track(self, auto=False):
+        name = self.queue.next(auto)
+        if name:
+            self.load_track(name)
+
+    def prev_track(self):
+        name = self.queue.prev()
+        if name:
+            self.load_track(name)
+
+    def load_track(self, name):
+        """Переключается на трек name; подготовленный заранее звук запускается сразу, без загрузки"""
+        if self.sound_on:
+            self.stop_music()
+        self.pending_track = name
+        requested = time.perf_counter()
+        self.preloader.get(name, lambda sound: self.start_sound(name, sound, requested))
+        self.manager.transition = SlideTransition(direction='left')
+        self.manager.current = 'unit'
 
+    def start_sound(self, name, sound, requested):
+        if name != self.pending_track:
+            if sound is not None:
+                self.release_sound(sound)
+            return
+        if sound is None:
+            print(f'Error: не удалось загрузить {name}')
+            return
+        try:
+            previous = self.sound
+            if previous is not None:
+                if self.sound_on:
+                    self.halt_sound()
+                self.release_sound(previous)
+            self.sound = sound
+            self.paused_position = 0
+            self.sound.bind(on_stop=self.on_sound_stop)
+            self.sound.play()
+            self.sound_on = True
+            self.previous_name = name
+            if metrics.enabled:
+                # Переключение — от запроса трека до старта звука; пауза — от конца прошлого трека
+                now = time.perf_counter()
+                metrics.record('track_switch', now - requested)
+                if self.ended_at is not None:
+                    metrics.record('track_gap', now - self.ended_at)
+            self.ended_at = None
+            self.dispatch('on_track_changed', name)
+            self.dispatch('on_play_state', True)
+            self.record_play(name)
         except Exception as e:
             print(f'Error: {e}')
+        self.prepare_next()
+
+    def record_play(self, path):
+        """Засчитывает прослушивание в фоне; умные плейлисты, состав которых от этого изменился, обновляются"""
+        def record():
+            changed = library.record_play(path)
+            if changed:
+                Clock.schedule_once(lambda dt: self.playlists_changed(changed))
+
+        threading.Thread(target=record, daemon=True).start()
+
+    def playlists_changed(self, names):
+        for name in names:
+            self.dispatch('on_queue_changed', name)
+
+    def prepare_next(self):
+        self.preloader.prepare(self.queue.peek_next())
+
+    def release_sound(self, sound):
+        """Выгружает звук в следующем кадре, чтобы освобождение не задерживало переключение"""
+        if sound is self.ignored_stop:
+            self.ignored_stop = None
+        Clock.schedule_once(lambda dt: sound.unload())
+
+
+class ProfileOverlay(Label):
+    """Полупрозрачная сводка метрик поверх интерфейса: время кадра и самые затратные таймеры"""
+
+    def __init__(self, **kwargs):
+        super(ProfileOverlay, self).__init__(halign='left', valign='top', font_size='13sp',
+                                             color=(1, 1, 0.4, 1), **kwargs)
+        self.bind(size=lambda instance, size: setattr(self, 'text_size', size))
+        with self.canvas.before:
+            Color(0, 0, 0, 0.6)
+            self.background = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self.update_background, size=self.update_background)
+        self.frame_event = Clock.schedule_interval(record_frame, 0)
+        self.refresh_event = Clock.schedule_interval(self.refresh, OVERLAY_INTERVAL)
+
+    def update_background(self, *args):
+        self.background.pos = self.pos
+        self.background.size = self.size
+
+    def refresh(self, dt):
+        snapshot = metrics.snapshot()
+        frame = snapshot['histograms'].get('frame')
+        lines = []
+        if frame:
+            lines.append(f"кадр: {frame['mean_ms']:.1f} мс, p95 {frame['p95_ms']:.1f}, max {frame['max_ms']:.0f}, "
+                         f"пропусков {snapshot['counters'].get('frame_drops', 0)}")
+        lines.extend(metrics.top())
+        self.text = '\n'.join(lines)
+
+    def close(self):
+        self.frame_event.cancel()
+        self.refresh_event.cancel()
 
 
 class MusicApp(App):
+    profile_overlay = None
+
+    def toggle_profiling(self):
+        """Включает сбор метрик с оверлеем; при выключении дописывает профиль в PROFILE_LOG"""
+        from kivy.core.window import Window
+        if self.profile_overlay is None:
+            metrics.enable(True)
+            self.profile_overlay = ProfileOverlay(size_hint=(None, None), size=(Window.width, Window.height * 0.3),
+                                                  pos=(0, Window.height * 0.7))
+            Window.add_widget(self.profile_overlay)
+        else:
+            self.profile_overlay.close()
+            Window.remove_widget(self.profile_overlay)
+            self.profile_overlay = None
+            metrics.dump(PROFILE_LOG)
+            metrics.enable(False)
+
+    def on_keyboard(self, window, key, *args):
+        if key == KEY_F12:
+            self.toggle_profiling()
+            return True
+        return False
+
     def build(self):
-        sm = ScreenManager()
-        sm.add_widget(MusicList(name="list"))
-        sm.add_widget(InfoWin(name="info"))
-        sm.add_widget(UnitMusicWin(name="unit"))
-        sm.add_widget(PlaylistWin(name="playlist"))
+        load_playlists()
+        startup.mark('playlists')
+        sm = LazyScreenManager()
+        music_list = MusicList(name="list")
+        sm.add_widget(music_list)
+
+        def build_unit(name):
+            # Пропущенные до создания события не важны: экран перерисуется в on_pre_enter
+            unit = UnitMusicWin(name=name)
+            music_list.bind(on_track_changed=unit.on_track_changed,
+                            on_play_state=unit.on_play_state)
+            return unit
+
+        sm.register("info", lambda name: InfoWin(name=name))
+        sm.register("unit", build_unit)
+        sm.register("playlist", lambda name: PlaylistWin(name=name))
+        startup.mark('build')
         return sm
 
+    def on_start(self):
+        from kivy.core.window import Window
+        Window.bind(on_flip=self.on_first_frame, on_keyboard=self.on_keyboard)
+        if metrics.enabled:
+            # Сбор включён переменной окружения с самого запуска — показываем и оверлей
+            self.toggle_profiling()
+
+    def on_first_frame(self, window):
+        window.unbind(on_flip=self.on_first_frame)
+        startup.mark('first_frame')
+        # Индекс читается и показывается уже после первого кадра, чтобы его время не зависело от размера медиатеки
+        self.root.get_screen('list').load_library(on_loaded=self.on_library_shown)
+
+    def on_library_shown(self):
+        startup.mark('list')
+        print(f'Запуск: {startup}')
+        if STARTUP_LOG:
+            startup.dump(STARTUP_LOG)
+        # Обход файлов начинаем, когда в списке весь индекс: новые треки сканера допишутся в конец
+        self.root.get_screen('list').start_scan()
+        # Порядки сортировки и группы строятся в фоне, чтобы первое переключение вида тоже было мгновенным
+        threading.Thread(target=library.prepare_views, daemon=True).start()
+
+    def on_stop(self):
+        scanner.cancel()
+        self.root.get_screen('list').stop_watching()
+        save_playlists()
+        if metrics.enabled:
+            metrics.dump(PROFILE_LOG)
+
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+
+STARTUP_LOG = os.environ.get('MUSIC_PLAYER_STARTUP_LOG')
+PROFILE = bool(os.environ.get('MUSIC_PLAYER_PROFILE'))
+PROFILE_LOG = os.environ.get('MUSIC_PLAYER_PROFILE_LOG', os.path.join('.', 'profile.jsonl'))
+# Верхние границы корзин гистограмм в миллисекундах; 16.7 и 33.3 — один и два кадра при 60 Гц
+FRAME_BUDGET = 1 / 60
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 16.7, 33.3, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+
+class StartupTimeline:
+    """Отметки фаз запуска: сколько прошло от старта процесса и от предыдущей отметки.
+
+    Отсчёт идёт с момента создания объекта, поэтому perf импортируется в main
+    первым. Каждая фаза отмечается один раз; dump() дописывает всю шкалу одной
+    JSON-строкой, чтобы время до первого кадра можно было сравнивать между версиями.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = []
+
+    def mark(self, phase):
+        if any(name == phase for name, _ in self.marks):
+            return
+        self.marks.append((phase, time.perf_counter() - self.started))
+
+    def phases(self):
+        """Возвращает список (фаза, секунды от старта, секунды от предыдущей фазы)"""
+        result = []
+        previous = 0.0
+        for phase, at in self.marks:
+            result.append((phase, at, at - previous))
+            previous = at
+        return result
+
+    def as_dict(self):
+        return {'time': time.time(), 'phases': [{'phase': phase, 'at': round(at, 4), 'took': round(took, 4)}
+                                                for phase, at, took in self.phases()]}
+
+    def dump(self, path):
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.as_dict(), ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f'Ошибка записи шкалы запуска: {e}')
+
+    def __str__(self):
+        return ', '.join(f'{phase} {took * 1000:.0f} мс' for phase, _, took in self.phases())
+
+
+class Histogram:
+    """Гистограмма задержек с фиксированными корзинами: запись — бисекция и пара сложений"""
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS_MS)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+        self.buckets[bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает доля fraction замеров"""
+        target = self.count * fraction
+        seen = 0
+        for bound, hits in zip(BUCKETS_MS, self.buckets):
+            seen += hits
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {'count': self.count, 'total_ms': round(self.total, 3), 'max_ms': round(self.max, 3),
+                'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+                'p50_ms': self.percentile(0.5), 'p95_ms': self.percentile(0.95), 'p99_ms': self.percentile(0.99),
+                'buckets': {str(bound): hits for bound, hits in zip(BUCKETS_MS, self.buckets) if hits}}
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.record(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """Именованные таймеры, счётчики и гистограммы задержек горячих путей.
+
+    Пока сбор выключен, timer() отдаёт общий пустой контекст, а timed() —
+    одну проверку флага перед вызовом, так что обёртки можно держать в коде
+    постоянно. Запись идёт под блокировкой: таймеры работают и в фоновых
+    потоках (сканер, пул чтения тегов, запись плейлистов). snapshot() и
+    dump() отдают всё накопленное с момента включения.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.since = time.time()
+        self.lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        """Включает или выключает сбор; при включении старые данные сбрасываются"""
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.since = time.time()
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                self.histograms[name] = histogram = Histogram()
+            histogram.add(seconds * 1000)
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timer(self, name):
+        """Контекстный менеджер, замеряющий блок под именем name"""
+        return _Timer(self, name) if self.enabled else NULL_TIMER
+
+    def timed(self, name=None):
+        """Декоратор: замеряет каждый вызов функции под именем name (по умолчанию — имя функции)"""
+        def decorator(fn):
+            label = name or fn.__qualname__
+
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(label, time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def snapshot(self):
+        with self.lock:
+            return {'time': time.time(), 'since': self.since,
+                    'histograms': {name: histogram.as_dict() for name, histogram in self.histograms.items()},
+                    'counters': dict(self.counters)}
+
+    def top(self, limit=8):
+        """Строки для оверлея: самые затратные по суммарному времени таймеры"""
+        with self.lock:
+            items = sorted(self.histograms.items(), key=lambda item: item[1].total, reverse=True)[:limit]
+            return [f'{name}: {histogram.count} x {histogram.total / histogram.count:.1f} мс, '
+                    f'p95 {histogram.percentile(0.95):.1f}, max {histogram.max:.1f}' for name, histogram in items]
+
+    def dump(self, path=PROFILE_LOG):
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + '\n')
+        except OSError as e:
+            print(f'Ошибка записи профиля: {e}')
+
+
+def instrument_clock(clock):
+    """Оборачивает колбэки, которые приложение ставит в Clock, таймерами clock:<имя функции>.
+
+    Обёртка ставится только пока сбор включён и только на функции не из
+    Kivy и не из этого модуля: внутренние события Kivy держат колбэки по
+    слабым ссылкам, и обёртка продлевала бы жизнь их виджетам.
+    """
+    schedule_once = clock.schedule_once
+    schedule_interval = clock.schedule_interval
+    create_trigger = clock.create_trigger
+
+    def wrap(callback):
+        module = getattr(callback, '__module__', None) or 'kivy'
+        if not metrics.enabled or module.startswith('kivy') or module == __name__:
+            return callback
+        name = getattr(callback, '__qualname__', repr(callback)).replace('.<locals>', '')
+        return metrics.timed('clock:' + name)(callback)
+
+    clock.schedule_once = lambda callback, timeout=0: schedule_once(wrap(callback), timeout)
+    clock.schedule_interval = lambda callback, timeout: schedule_interval(wrap(callback), timeout)
+    clock.create_trigger = lambda callback, timeout=0, interval=False, release_ref=True: create_trigger(
+        wrap(callback), timeout, interval, release_ref)
+
+
+def record_frame(dt):
+    """Колбэк Clock на каждый кадр: dt — время от предыдущего кадра"""
+    metrics.record('frame', dt)
+    if dt > FRAME_BUDGET * 2:
+        metrics.count('frame_drops')
+
+
+startup = StartupTimeline()
+metrics = Metrics(PROFILE)
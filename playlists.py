@@ -0,0 +1,256 @@
+import os
+import json
+import threading
+from perf import metrics
+
+PLAYLISTS_PATH = os.path.join('.', 'playlists.json')
+FORMAT_VERSION = 2
+FLUSH_DELAY = 1.0
+JOURNAL_MIN_BYTES = 64 * 1024
+
+
+def write_atomic(path, data):
+    """Записывает файл через временный файл, fsync и rename, чтобы сбой не оставил его обрезанным"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def append_durably(path, data):
+    """Дописывает байты в конец файла с fsync; если запись не удалась, отрезает недописанный хвост"""
+    with open(path, 'ab', buffering=0) as f:
+        start = f.tell()
+        try:
+            written = 0
+            while written < len(data):
+                written += f.write(data[written:])
+            os.fsync(f.fileno())
+        except OSError:
+            f.truncate(start)
+            raise
+
+
+def _skip_ws(text, pos):
+    while pos < len(text) and text[pos] in ' \t\r\n':
+        pos += 1
+    return pos
+
+
+def salvage_object(text, pos=0):
+    """Разбирает JSON-объект, оставляя все пары, прочитанные целиком до места обрыва"""
+    decoder = json.JSONDecoder()
+    result = {}
+    try:
+        pos = _skip_ws(text, pos)
+        if text[pos] != '{':
+            return result
+        pos += 1
+        while True:
+            pos = _skip_ws(text, pos)
+            if text[pos] == '}':
+                return result
+            key, pos = decoder.raw_decode(text, pos)
+            pos = _skip_ws(text, pos)
+            if text[pos] != ':':
+                return result
+            pos = _skip_ws(text, pos + 1)
+            try:
+                value, pos = decoder.raw_decode(text, pos)
+            except ValueError:
+                if text[pos] == '{':
+                    result[key] = salvage_object(text, pos)
+                return result
+            result[key] = value
+            pos = _skip_ws(text, pos)
+            if text[pos] == ',':
+                pos += 1
+    except (IndexError, ValueError):
+        return result
+
+
+class PlaylistStore:
+    """Плейлисты с журналом изменений.
+
+    Каждое изменение сразу применяется к словарю playlists и попадает в очередь;
+    очередь сбрасывается одной отложенной записью в конец журнала. Полный снимок
+    (playlists.json) переписывается атомарно только при уплотнении, когда журнал
+    становится больше снимка. Записи журнала нумеруются, поэтому после сбоя
+    между записью снимка и очисткой журнала уже учтённые изменения не
+    применяются повторно.
+
+    Рядом с обычными плейлистами в smart лежат умные: имя -> определение с
+    правилами (см. smart.compile_rule). Имена у них общие с обычными.
+    """
+
+    def __init__(self, path=PLAYLISTS_PATH, flush_delay=FLUSH_DELAY):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.flush_delay = flush_delay
+        self.playlists = {}
+        self.smart = {}
+        self.seq = 0
+        self.pending = []
+        self.timer = None
+        self.snapshot_bytes = 0
+        self.journal_bytes = 0
+        self.lock = threading.RLock()
+
+    def load(self):
+        """Загружает снимок и доигрывает журнал; обрезанные файлы читаются до места обрыва"""
+        with self.lock:
+            snapshot_seq, data, smart = self._read_snapshot()
+            self.playlists.clear()
+            self.playlists.update((name, list(tracks)) for name, tracks in data.items() if isinstance(tracks, list))
+            self.smart.clear()
+            self.smart.update((name, definition) for name, definition in smart.items() if isinstance(definition, dict))
+            self.seq = snapshot_seq
+            for op in self._read_journal():
+                # Записи из снимка и повторно дописанные после сбоя записи уже применены
+                if op.get('seq', 0) > self.seq:
+                    self._apply(op)
+                    self.seq = op['seq']
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            return 0, {}, {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        self.snapshot_bytes = len(text)
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            print(f"Ошибка при загрузке плейлистов, восстанавливаю прочитанное: {e}")
+            data = salvage_object(text)
+        if data.get('version') == FORMAT_VERSION and isinstance(data.get('playlists'), dict):
+            smart = data.get('smart')
+            return data.get('seq', 0), data['playlists'], smart if isinstance(smart, dict) else {}
+        # Старый формат: просто словарь имя -> список путей
+        return 0, data, {}
+
+    def _read_journal(self):
+        self.journal_bytes = 0
+        if not os.path.exists(self.journal_path):
+            return []
+        ops = []
+        torn = False
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('запись без конца строки')
+                    ops.append(json.loads(line.decode('utf-8')))
+                except ValueError:
+                    # Последняя строка могла оборваться при сбое — всё до неё уже прочитано
+                    torn = True
+                    break
+                self.journal_bytes += len(line)
+        if torn:
+            # Обрывок отрезается, иначе следующая запись допишется прямо к нему и тоже не прочитается
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(self.journal_bytes)
+                f.flush()
+                os.fsync(f.fileno())
+        return ops
+
+    def _apply(self, op):
+        name = op.get('name')
+        kind = op.get('op')
+        if kind == 'create':
+            self.playlists.setdefault(name, [])
+        elif kind == 'delete':
+            self.playlists.pop(name, None)
+            self.smart.pop(name, None)
+        elif kind == 'add' and name in self.playlists:
+            self.playlists[name].extend(op['tracks'])
+        elif kind == 'remove' and name in self.playlists:
+            tracks = self.playlists[name]
+            if 0 <= op['index'] < len(tracks):
+                del tracks[op['index']]
+        elif kind == 'set':
+            self.playlists[name] = list(op['tracks'])
+        elif kind == 'smart':
+            self.smart[name] = op['definition']
+
+    def _record(self, **op):
+        with self.lock:
+            self.seq += 1
+            op['seq'] = self.seq
+            self._apply(op)
+            self.pending.append(op)
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.timer is None:
+            self.timer = threading.Timer(self.flush_delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def create(self, name):
+        self._record(op='create', name=name)
+
+    def delete(self, name):
+        self._record(op='delete', name=name)
+
+    def add_tracks(self, name, tracks):
+        if tracks:
+            self._record(op='add', name=name, tracks=list(tracks))
+
+    def remove_track(self, name, index):
+        self._record(op='remove', name=name, index=index)
+
+    def set_tracks(self, name, tracks):
+        self._record(op='set', name=name, tracks=list(tracks))
+
+    def set_smart(self, name, definition):
+        """Создаёт умный плейлист или заменяет его правила"""
+        self._record(op='smart', name=name, definition=definition)
+
+    def relink(self, mapping):
+        """Заменяет записи плейлистов по словарю старое -> новое и возвращает имена изменённых плейлистов"""
+        if not mapping:
+            return []
+        changed = []
+        with self.lock:
+            for name, tracks in list(self.playlists.items()):
+                if any(entry in mapping for entry in tracks):
+                    self.set_tracks(name, [mapping.get(entry, entry) for entry in tracks])
+                    changed.append(name)
+        return changed
+
+    def flush(self):
+        """Дописывает накопленные изменения в журнал и при необходимости уплотняет его"""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            ops, self.pending = self.pending, []
+            if not ops:
+                return
+            try:
+                with metrics.timer('playlists_flush'):
+                    lines = ''.join(json.dumps(op, ensure_ascii=False) + '\n' for op in ops).encode('utf-8')
+                    append_durably(self.journal_path, lines)
+                    self.journal_bytes += len(lines)
+                    if self.journal_bytes > max(JOURNAL_MIN_BYTES, self.snapshot_bytes):
+                        self.compact()
+            except Exception as e:
+                print(f"Ошибка при сохранении плейлистов: {e}")
+                # Изменения остаются в очереди до следующей попытки. Если упало уплотнение, они уже
+                # есть в журнале, но повторная запись безопасна: по номерам они не применятся дважды
+                self.pending = ops + self.pending
+                self._schedule_flush()
+
+    def compact(self):
+        """Атомарно записывает полный снимок и очищает журнал"""
+        with self.lock:
+            data = json.dumps({'version': FORMAT_VERSION, 'seq': self.seq, 'playlists': self.playlists,
+                               'smart': self.smart}, ensure_ascii=False)
+            write_atomic(self.path, data)
+            self.snapshot_bytes = len(data)
+            with open(self.journal_path, 'w', encoding='utf-8') as f:
+                f.flush()
+                os.fsync(f.fileno())
+            self.journal_bytes = 0
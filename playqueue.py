@@ -0,0 +1,135 @@
+import random
+
+REPEAT_OFF = 'off'
+REPEAT_ALL = 'all'
+REPEAT_ONE = 'one'
+REPEAT_MODES = (REPEAT_OFF, REPEAT_ALL, REPEAT_ONE)
+
+
+class PlayQueue:
+    """Очередь воспроизведения из медиатеки или плейлиста.
+
+    Треки хранятся в слотах tracks, порядок проигрывания — список номеров
+    слотов order, текущая позиция — индекс в order. Поэтому переходы вперёд
+    и назад выполняются за O(1) и не путаются в повторяющихся треках.
+    Перемешивание один раз строит перестановку; исходный порядок хранится
+    в base, пока включено перемешивание.
+    """
+
+    def __init__(self, tracks=(), start=0, source=None, shuffle=False, repeat=REPEAT_ALL):
+        self.tracks = list(tracks)
+        self.source = source
+        self.order = list(range(len(self.tracks)))
+        self.position = min(max(start, 0), len(self.order) - 1) if self.order else 0
+        self.repeat = repeat
+        self.shuffle = False
+        self.base = None
+        self.removed = set()
+        if shuffle:
+            self.set_shuffle(True)
+
+    def __len__(self):
+        return len(self.order)
+
+    def current(self):
+        if not self.order:
+            return None
+        return self.tracks[self.order[self.position]]
+
+    def next(self, auto=False):
+        """Переходит к следующему треку; auto=True — переход по окончании трека"""
+        if not self.order:
+            return None
+        if auto and self.repeat == REPEAT_ONE:
+            return self.current()
+        if self.position + 1 < len(self.order):
+            self.position += 1
+        elif self.repeat != REPEAT_OFF:
+            self.position = 0
+        else:
+            return None
+        return self.current()
+
+    def peek_next(self, auto=True):
+        """Возвращает трек, который заиграет следующим, не сдвигая позицию"""
+        if not self.order:
+            return None
+        if auto and self.repeat == REPEAT_ONE:
+            return self.current()
+        if self.position + 1 < len(self.order):
+            return self.tracks[self.order[self.position + 1]]
+        if self.repeat != REPEAT_OFF:
+            return self.tracks[self.order[0]]
+        return None
+
+    def prev(self):
+        if not self.order:
+            return None
+        if self.position > 0:
+            self.position -= 1
+        elif self.repeat != REPEAT_OFF:
+            self.position = len(self.order) - 1
+        else:
+            return None
+        return self.current()
+
+    def set_repeat(self, mode):
+        if mode not in REPEAT_MODES:
+            raise ValueError(f'Неизвестный режим повтора: {mode}')
+        self.repeat = mode
+
+    def cycle_repeat(self):
+        self.repeat = REPEAT_MODES[(REPEAT_MODES.index(self.repeat) + 1) % len(REPEAT_MODES)]
+        return self.repeat
+
+    def set_shuffle(self, enabled):
+        """Включает перемешивание (текущий трек остаётся текущим) или возвращает исходный порядок"""
+        if enabled == self.shuffle:
+            return
+        current_slot = self.order[self.position] if self.order else None
+        if enabled:
+            self.base = self.order
+            rest = [slot for slot in self.order if slot != current_slot]
+            random.shuffle(rest)
+            self.order = ([current_slot] if current_slot is not None else []) + rest
+            self.position = 0
+        else:
+            self.order = [slot for slot in self.base if slot not in self.removed]
+            self.base = None
+            self.removed = set()
+            self.position = self.order.index(current_slot) if current_slot is not None else 0
+        self.shuffle = enabled
+
+    def play_next(self, path):
+        """Ставит трек сразу после текущего"""
+        slot = len(self.tracks)
+        self.tracks.append(path)
+        if not self.order:
+            self.order.append(slot)
+            self.position = 0
+        else:
+            self.order.insert(self.position + 1, slot)
+        if self.base is not None:
+            self.base.append(slot)
+
+    def remove_current(self):
+        """Убирает текущий трек из очереди и возвращает тот, что встал на его место"""
+        if not self.order:
+            return None
+        slot = self.order.pop(self.position)
+        if self.base is not None:
+            self.removed.add(slot)
+        if self.position >= len(self.order):
+            self.position = max(len(self.order) - 1, 0)
+        return self.current()
+
+    def remove_tracks(self, paths):
+        """Убирает из очереди треки из множества paths; позиция остаётся на том же или следующем треке"""
+        slots = {slot for slot in self.order if self.tracks[slot] in paths}
+        if not slots:
+            return
+        before = sum(1 for slot in self.order[:self.position] if slot in slots)
+        self.order = [slot for slot in self.order if slot not in slots]
+        if self.base is not None:
+            self.removed |= slots
+        self.position = min(self.position - before, max(len(self.order) - 1, 0))
@@ -0,0 +1,77 @@
+import threading
+from perf import metrics
+
+
+class SoundPreloader:
+    """Загружает следующий трек в фоновом потоке, чтобы переключение не ждало SoundLoader.
+
+    loader(path) вызывается в рабочем потоке, schedule(fn) должен выполнить fn
+    в главном потоке, release(sound) освобождает ненужный звук. Готовым держится
+    не больше одного звука: новый prepare() выбрасывает предыдущий.
+    Попадания и промахи считаются в metrics (preload_hits, preload_misses).
+    """
+
+    def __init__(self, loader, schedule, release):
+        self.loader = loader
+        self.schedule = schedule
+        self.release = release
+        self.path = None
+        self.sound = None
+        self.ready = False
+        self.waiter = None
+        self.generation = 0
+
+    def prepare(self, path):
+        """Начинает фоновую загрузку path, если он ещё не загружен или не загружается"""
+        if path is None or path == self.path:
+            return
+        self.discard()
+        self.generation += 1
+        self.path = path
+        threading.Thread(target=self._load, args=(path, self.generation), daemon=True).start()
+
+    def get(self, path, callback):
+        """Передаёт звук для path в callback: сразу, если он готов, иначе после загрузки"""
+        if path == self.path and self.ready:
+            metrics.count('preload_hits')
+            sound = self._take()
+            callback(sound)
+            return
+        metrics.count('preload_misses')
+        self.prepare(path)
+        self.waiter = callback
+
+    def discard(self):
+        if self.ready and self.sound is not None:
+            self.release(self.sound)
+        self.generation += 1
+        self.path = None
+        self.sound = None
+        self.ready = False
+        self.waiter = None
+
+    def _take(self):
+        sound = self.sound
+        self.path = None
+        self.sound = None
+        self.ready = False
+        return sound
+
+    def _load(self, path, generation):
+        try:
+            sound = self.loader(path)
+        except Exception as e:
+            print(f'Ошибка предзагрузки {path}: {e}')
+            sound = None
+        self.schedule(lambda: self._loaded(generation, sound))
+
+    def _loaded(self, generation, sound):
+        if generation != self.generation:
+            if sound is not None:
+                self.release(sound)
+            return
+        self.sound = sound
+        self.ready = True
+        if self.waiter is not None:
+            waiter, self.waiter = self.waiter, None
+            waiter(self._take())
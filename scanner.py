@@ -0,0 +1,103 @@
+import time
+import threading
+from library import ScanStats, PROBE_WORKERS
+from perf import metrics
+
+PROGRESS_INTERVAL = 0.25
+
+
+class LibraryScanner:
+    """Сканирует медиатеку в фоновом потоке и отдаёт найденные треки пачками.
+
+    Колбэки on_batch(paths), on_progress(stats) и on_done(stats) вызываются
+    из рабочего потока, поэтому интерфейс должен сам перенести их в главный
+    поток. on_progress вызывается не чаще раза в PROGRESS_INTERVAL секунд,
+    сколько бы файлов ни прочитал пул.
+    """
+
+    def __init__(self, library, on_batch=None, on_done=None, batch_size=200, on_progress=None,
+                 workers=PROBE_WORKERS):
+        self.library = library
+        self.on_batch = on_batch
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.batch_size = batch_size
+        self.workers = workers
+        self.options = None
+        self.full = False
+        self.stats = None
+        self._thread = None
+        self._cancel_event = None
+        self._last_progress = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, options, full=False):
+        """Запускает сканирование, прерывая предыдущее"""
+        self.cancel()
+        self.options = options
+        self.full = full
+        self.stats = ScanStats()
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(target=self._run,
+                                        args=(options, full, self._cancel_event, self._thread, self.stats),
+                                        daemon=True)
+        self._thread.start()
+
+    def restart(self):
+        """Перезапускает сканирование с прежними параметрами"""
+        if self.options is not None:
+            self.start(self.options, self.full)
+
+    def check(self):
+        """Дешёвая проверка без обхода: если у какого-то каталога сменился mtime, запускает сканирование.
+
+        Замена наблюдению за файловой системой там, где его нет; сверка mtime
+        идёт в фоновом потоке и пропускается, пока сканирование уже идёт.
+        """
+        if self.running or self.options is None:
+            return
+
+        def run():
+            if self.library.stale_dirs() and not self.running:
+                self.restart()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def cancel(self):
+        """Просит текущее сканирование остановиться"""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+
+    def _run(self, options, full, cancel_event, previous, stats):
+        # Прерванный обход ещё может дописывать каталог в индекс — ждём его в фоне
+        if previous is not None:
+            previous.join()
+        batch = []
+        try:
+            with metrics.timer('scan'):
+                for tracks in self.library.iter_rescan(options, full, cancel_event, stats, self.workers,
+                                                       progress=self._progress):
+                    batch.extend(tracks)
+                    if len(batch) >= self.batch_size:
+                        self._emit(batch, cancel_event)
+                        batch = []
+                self._emit(batch, cancel_event)
+        except Exception as e:
+            print(f'Ошибка сканирования медиатеки: {e}')
+        if cancel_event.is_set():
+            stats.finish(cancelled=True)
+        if self.on_done:
+            self.on_done(stats)
+
+    def _emit(self, batch, cancel_event):
+        if batch and self.on_batch and not cancel_event.is_set():
+            self.on_batch(batch)
+
+    def _progress(self, stats):
+        now = time.monotonic()
+        if self.on_progress and now - self._last_progress >= PROGRESS_INTERVAL:
+            self._last_progress = now
+            self.on_progress(stats)
@@ -0,0 +1,133 @@
+import re
+import unicodedata
+from bisect import bisect_left
+
+TOKEN_RE = re.compile(r'\w+')
+PREFIX_END = '\U0010ffff'
+PREFIX_CACHE = 32
+
+
+class _FoldTable(dict):
+    """Таблица для str.translate: снимает диакритику, вычисляя замену каждого символа один раз"""
+
+    def __missing__(self, code):
+        ch = chr(code)
+        folded = ''.join(c for c in unicodedata.normalize('NFKD', ch) if not unicodedata.combining(c))
+        self[code] = folded if folded and folded != ch else code
+        return self[code]
+
+
+# й — отдельная буква, а не и с кратким знаком, поэтому не раскладывается; ё ищется как е
+FOLD = _FoldTable({ord('й'): 'й', ord('ё'): 'е'})
+
+
+def normalize(text):
+    """Приводит строку к виду для поиска: без регистра и диакритики, с ё -> е"""
+    text = text.casefold()
+    return text if text.isascii() else text.translate(FOLD)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(normalize(text))
+
+
+class SearchIndex:
+    """Поисковый индекс по названию, исполнителю и альбому с поиском по префиксам слов.
+
+    Для каждого нормализованного слова хранится множество путей треков, а
+    отсортированный список слов позволяет бисекцией найти все слова с нужным
+    префиксом. Запрос из нескольких слов — пересечение результатов по каждому.
+    Результаты по префиксам кэшируются до следующего изменения индекса, так что
+    при наборе запроса заново считается только последнее слово. Треки
+    добавляются и удаляются по одному, без перестройки всего индекса.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.postings = {}
+        self.tokens = []
+        self.new_tokens = []
+        self.prefix_cache = {}
+        self.initials = {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, path, *fields):
+        """Добавляет трек или переиндексирует его, если поля изменились; без изменений ничего не делает"""
+        old = self.docs.get(path)
+        if old is not None:
+            if old[0] == fields:
+                return
+            self.remove(path)
+        tokens = frozenset(tokenize(' '.join(field for field in fields if field)))
+        self.docs[path] = (fields, tokens)
+        self.prefix_cache.clear()
+        for token in tokens:
+            paths = self.postings.get(token)
+            if paths is None:
+                self.postings[token] = paths = set()
+                self.new_tokens.append(token)
+            paths.add(path)
+        for initial in {token[0] for token in tokens}:
+            self.initials.setdefault(initial, set()).add(path)
+
+    def remove(self, path):
+        fields, tokens = self.docs.pop(path, ((), ()))
+        if tokens:
+            self.prefix_cache.clear()
+        for token in tokens:
+            paths = self.postings[token]
+            paths.discard(path)
+            if not paths:
+                # Слово остаётся в отсортированном списке до следующей полной сортировки; поиск его пропустит
+                del self.postings[token]
+        for initial in {token[0] for token in tokens}:
+            self.initials[initial].discard(path)
+
+    def prefix_matches(self, prefix):
+        """Возвращает пути треков, в которых есть слово, начинающееся с prefix (результат не изменять)"""
+        if len(prefix) == 1:
+            # Однобуквенные префиксы совпадают с тысячами слов, поэтому их множества ведутся постоянно
+            return self.initials.get(prefix, set())
+        result = self.prefix_cache.get(prefix)
+        if result is not None:
+            return result
+        if self.new_tokens:
+            self._merge_tokens()
+        postings = self.postings
+        lo = bisect_left(self.tokens, prefix)
+        hi = bisect_left(self.tokens, prefix + PREFIX_END, lo)
+        result = set().union(*[postings[token] for token in self.tokens[lo:hi] if token in postings])
+        if len(self.prefix_cache) >= PREFIX_CACHE:
+            self.prefix_cache.pop(next(iter(self.prefix_cache)))
+        self.prefix_cache[prefix] = result
+        return result
+
+    def _merge_tokens(self):
+        """Вставляет новые слова в отсортированный список; после массовой загрузки сортирует заново"""
+        if len(self.new_tokens) * 8 < len(self.tokens):
+            tokens = self.tokens
+            for token in self.new_tokens:
+                if token not in self.postings:
+                    continue
+                # Удалённое и снова добавленное слово могло остаться в списке с прошлого раза
+                position = bisect_left(tokens, token)
+                if position == len(tokens) or tokens[position] != token:
+                    tokens.insert(position, token)
+        else:
+            self.tokens = sorted(self.postings)
+        self.new_tokens = []
+
+    def search(self, query):
+        """Возвращает множество путей под запрос (не изменять) или None, если запрос пустой"""
+        terms = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not terms:
+            return None
+        # Самый длинный префикс обычно самый избирательный: с него начинаем пересечение
+        result = self.prefix_matches(terms[0])
+        for term in terms[1:]:
+            if not result:
+                break
+            result = result & self.prefix_matches(term)
+        return result
@@ -0,0 +1,161 @@
+import time
+from search import normalize
+
+DAY = 24 * 60 * 60
+MATCH_MODES = ('all', 'any')
+
+
+def compile_rule(rule, table, played):
+    """Превращает правило в проверку номера строки TrackTable; возвращает (проверка, зависит ли от времени).
+
+    Правила:
+        {'field': 'artist' | 'album' | 'title', 'contains': текст}
+        {'field': 'duration', 'min': секунды, 'max': секунды}  — любая граница необязательна
+        {'field': 'folder', 'prefix': каталог}
+        {'field': 'added', 'days': N}  — добавлен не раньше N дней назад
+        {'field': 'played', 'never': True}  — ни разу не проигрывался (False — проигрывался)
+    """
+    field = rule.get('field')
+    if field in ('artist', 'album'):
+        needle = normalize(rule['contains'])
+        strings, values = table.pools[field].strings, getattr(table, field)
+        # Строка пула под номером не меняется, так что ответ для неё считается один раз
+        memo = {}
+
+        def test(row):
+            number = values[row]
+            hit = memo.get(number)
+            if hit is None:
+                hit = memo[number] = needle in normalize(strings[number] or '')
+            return hit
+        return test, False
+    if field == 'title':
+        needle, titles = normalize(rule['contains']), table.title
+        return (lambda row: needle in normalize(titles[row] or '')), False
+    if field == 'duration':
+        low = rule.get('min')
+        high = rule.get('max')
+        low = float('-inf') if low is None else low
+        high = float('inf') if high is None else high
+        durations = table.duration
+        return (lambda row: low <= durations[row] <= high), False
+    if field == 'folder':
+        prefix = rule['prefix'].replace('\\', '/').rstrip('/') + '/'
+        paths = table.path
+        return (lambda row: paths[row].startswith(prefix)), False
+    if field == 'added':
+        seconds = rule['days'] * DAY
+        added = table.added
+        return (lambda row: added[row] >= time.time() - seconds), True
+    if field == 'played':
+        ids = table.track_id
+        if rule.get('never', True):
+            return (lambda row: ids[row] not in played), False
+        return (lambda row: ids[row] in played), False
+    raise ValueError(f'Неизвестное правило умного плейлиста: {rule}')
+
+
+def make_definition(match='all', artist=None, album=None, title=None, min_duration=None, max_duration=None,
+                    folder=None, added_days=None, never_played=False):
+    """Собирает определение умного плейлиста из заполненных полей; пустые поля правил не дают"""
+    if match not in MATCH_MODES:
+        raise ValueError(f'Неизвестный режим совпадения: {match}')
+    rules = [{'field': field, 'contains': value} for field, value in
+             (('artist', artist), ('album', album), ('title', title)) if value]
+    if min_duration is not None or max_duration is not None:
+        rules.append({'field': 'duration', 'min': min_duration, 'max': max_duration})
+    if folder:
+        rules.append({'field': 'folder', 'prefix': folder})
+    if added_days is not None:
+        rules.append({'field': 'added', 'days': added_days})
+    if never_played:
+        rules.append({'field': 'played', 'never': True})
+    return {'match': match, 'rules': rules}
+
+
+def compile_playlist(definition, table, played):
+    """Проверка строки по всем правилам определения {'match': 'all' | 'any', 'rules': [...]}"""
+    compiled = [compile_rule(rule, table, played) for rule in definition.get('rules', ())]
+    checks = [check for check, _ in compiled]
+    timed = any(timed for _, timed in compiled)
+    if definition.get('match', 'all') == 'any':
+        return (lambda row: any(check(row) for check in checks)), timed
+    return (lambda row: all(check(row) for check in checks)), timed
+
+
+class SmartPlaylists:
+    """Умные плейлисты: состав вычисляется по правилам из колонок TrackTable и дальше поддерживается сам.
+
+    Целиком состав считается один раз — при первом запросе после определения
+    или массовой загрузки таблицы. Потом таблица сообщает о каждом изменённом
+    треке (insert и discard), и проверяется только он. Прослушивание меняет
+    правило «ни разу не проигрывался» без изменения таблицы, поэтому о нём
+    сообщают отдельно через refresh(). Правило «добавлен за N дней» со временем
+    может только перестать выполняться, так что при запросе перепроверяются
+    лишь текущие участники, а не вся медиатека.
+    """
+
+    def __init__(self, table, played):
+        self.table = table
+        self.played = played
+        self.definitions = {}
+        self.compiled = {}
+        self.members = {}
+        table.listeners.append(self)
+
+    def define(self, name, definition):
+        self.definitions[name] = definition
+        self.compiled[name] = compile_playlist(definition, self.table, self.played)
+        self.members[name] = None
+
+    def remove(self, name):
+        self.definitions.pop(name, None)
+        self.compiled.pop(name, None)
+        self.members.pop(name, None)
+
+    def invalidate(self):
+        """Забывает посчитанный состав; он пересчитается при следующем запросе"""
+        for name in self.members:
+            self.members[name] = None
+
+    def paths(self, name):
+        """Пути треков плейлиста в порядке путей"""
+        if name not in self.members:
+            return []
+        members = self.members[name]
+        test, timed = self.compiled[name]
+        if members is None:
+            path = self.table.path
+            members = self.members[name] = {path[row] for row in self.table.live_rows() if test(row)}
+        elif timed:
+            rows = self.table.rows
+            members.difference_update([path for path in members if not test(rows[path])])
+        return sorted(members)
+
+    def insert(self, row):
+        path = self.table.path[row]
+        for name, members in self.members.items():
+            if members is not None and self.compiled[name][0](row):
+                members.add(path)
+
+    def discard(self, row):
+        path = self.table.path[row]
+        for members in self.members.values():
+            if members is not None:
+                members.discard(path)
+
+    def refresh(self, row):
+        """Перепроверяет один трек, не менявшийся в таблице; возвращает имена плейлистов, где он появился или пропал"""
+        path = self.table.path[row]
+        changed = []
+        for name, members in self.members.items():
+            if members is None:
+                continue
+            if self.compiled[name][0](row):
+                if path not in members:
+                    members.add(path)
+                    changed.append(name)
+            elif path in members:
+                members.discard(path)
+                changed.append(name)
+        return changed
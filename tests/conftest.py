@@ -0,0 +1,19 @@
+import os
+import sys
+import pytest
+
+# Модули приложения лежат в корне репозитория, без пакета
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Минимальный MP3 без тегов: mutagen читает его как трек длиной около четверти секунды
+FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+@pytest.fixture
+def write_track():
+    def write(path, frames=10):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(FRAME * frames)
+        return path
+    return write
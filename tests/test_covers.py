@@ -0,0 +1,31 @@
+import os
+import itertools
+import covers
+from covers import CoverCache
+
+
+def add_cover(path, data):
+    from mutagen.id3 import ID3, APIC
+    tags = ID3()
+    tags.add(APIC(encoding=3, mime='image/png', type=3, desc='', data=data))
+    tags.save(path)
+
+
+def test_cover_used_recently_is_evicted_last(tmp_path, write_track, monkeypatch):
+    clock = itertools.count(1000)
+    monkeypatch.setattr(covers, 'time', type('Clock', (), {'time': staticmethod(lambda: next(clock))}))
+    tracks = []
+    for name in 'abc':
+        path = write_track(str(tmp_path / 'music' / f'{name}.mp3'))
+        add_cover(path, b'\x89PNG' + name.encode() * 1000)
+        tracks.append(path)
+    cache = CoverCache(str(tmp_path / 'covers'), max_disk_bytes=2500)
+    first, second, third = tracks
+    first_cover = cache.cover_path(first)
+    second_cover = cache.cover_path(second)
+    assert cache.cover_path(first) == first_cover
+
+    cache.cover_path(third)
+    assert os.path.exists(first_cover)
+    assert not os.path.exists(second_cover)
+    cache.close()
@@ -0,0 +1,31 @@
+import os
+from engine import LibraryEngine
+from library import ScanOptions
+
+
+def make_engine(tmp_path):
+    return LibraryEngine(index_path=str(tmp_path / 'library.db'), playlists_path=str(tmp_path / 'playlists.json'),
+                         settings_path=str(tmp_path / 'scan_settings.json'), covers_dir=str(tmp_path / 'covers'))
+
+
+def test_rebase_moves_saved_roots_with_the_index(tmp_path, write_track):
+    old_root, new_root = str(tmp_path / 'old'), str(tmp_path / 'new')
+    write_track(os.path.join(old_root, 'Artist', 'one.mp3'))
+    write_track(os.path.join(old_root, 'Artist', 'two.mp3'))
+    engine = make_engine(tmp_path)
+    engine.save_scan_options(ScanOptions([old_root], [os.path.join(old_root, 'Skip')]))
+    assert engine.scan().tracks_found == 2
+    engine.close()
+
+    os.rename(old_root, new_root)
+    engine = make_engine(tmp_path)
+    engine.rebase(old_root, new_root)
+    engine.close()
+
+    engine = make_engine(tmp_path)
+    assert engine.scan_options.roots == [new_root]
+    assert engine.scan_options.exclude == [os.path.join(new_root, 'Skip')]
+    stats = engine.scan()
+    assert engine.library.counts()['tracks'] == 2
+    assert stats.tags_read == 0
+    engine.close()
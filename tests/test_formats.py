@@ -0,0 +1,26 @@
+import pytest
+from formats import read_tags
+
+FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('data', [
+    (b'\xff\xfa\x90\x64' + b'\x00' * 413) * 10,
+    b'\x00' * 300 + FRAME * 10,
+], ids=['crc', 'leading-zeros'])
+def test_mp3_unknown_to_filetype_is_read_by_extension(tmp_path, data):
+    fields = read_tags(write(tmp_path, 'track.mp3', data))
+
+    assert fields['title'] == 'Unknown Title'
+    assert fields['duration'] > 0
+
+
+def test_not_audio_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        read_tags(write(tmp_path, 'page.mp3', b'<!DOCTYPE html><html><body>404 Not Found</body></html>'))
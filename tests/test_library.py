@@ -0,0 +1,107 @@
+import os
+from library import LibraryIndex, ScanOptions
+
+
+def test_missing_root_keeps_its_tracks(tmp_path, write_track):
+    card, phone = str(tmp_path / 'card'), str(tmp_path / 'phone')
+    write_track(os.path.join(card, 'Album', 'one.mp3'))
+    write_track(os.path.join(card, 'two.mp3'))
+    write_track(os.path.join(phone, 'three.mp3'))
+    library = LibraryIndex(str(tmp_path / 'library.db'))
+    options = ScanOptions([card, phone])
+    library.rescan(options)
+    assert library.counts()['tracks'] == 3
+
+    # Карта памяти не смонтирована: корня нет, но её треки не удалены
+    os.rename(card, str(tmp_path / 'unmounted'))
+    library.rescan(options)
+    assert library.counts()['tracks'] == 3
+    assert library.counts()['dirs'] == 3
+
+    os.rename(str(tmp_path / 'unmounted'), card)
+    stats = library.rescan(options)
+    assert library.counts()['tracks'] == 3
+    assert stats.tags_read == 0
+    library.close()
+
+
+def test_removed_dir_is_dropped(tmp_path, write_track):
+    root = str(tmp_path / 'music')
+    write_track(os.path.join(root, 'Album', 'one.mp3'))
+    write_track(os.path.join(root, 'two.mp3'))
+    library = LibraryIndex(str(tmp_path / 'library.db'))
+    options = ScanOptions([root])
+    library.rescan(options)
+
+    os.remove(os.path.join(root, 'Album', 'one.mp3'))
+    os.rmdir(os.path.join(root, 'Album'))
+    library.rescan(options)
+    assert library.paths() == [os.path.join(root, 'two.mp3')]
+    library.close()
+
+
+def test_file_changed_in_place_is_read_again(tmp_path, write_track):
+    root = str(tmp_path / 'music')
+    path = write_track(os.path.join(root, 'one.mp3'), frames=10)
+    library = LibraryIndex(str(tmp_path / 'library.db'))
+    options = ScanOptions([root])
+    library.rescan(options)
+    assert library.take_changed_paths() == {path}
+    duration = library.metadata(path).duration
+
+    # Теги правятся на месте: меняется файл, а mtime каталога остаётся прежним
+    dir_times = os.stat(root).st_atime, os.stat(root).st_mtime
+    write_track(path, frames=40)
+    os.utime(root, dir_times)
+    stats = library.rescan(options)
+    assert stats.tags_read == 1
+    assert library.metadata(path).duration > duration
+    assert library.take_changed_paths() == {path}
+    library.rescan(options)
+    assert library.take_changed_paths() == set()
+    library.close()
+
+
+def added_of(library, path):
+    library.load_metadata()
+    table = library.table
+    return table.added[table.rows[path]]
+
+
+def test_moved_file_keeps_its_added_date(tmp_path, write_track):
+    root = str(tmp_path / 'music')
+    first = write_track(os.path.join(root, 'Inbox', 'one.mp3'))
+    second = write_track(os.path.join(root, 'Inbox', 'two.mp3'), frames=20)
+    library = LibraryIndex(str(tmp_path / 'library.db'))
+    options = ScanOptions([root])
+    library.rescan(options)
+    added = added_of(library, first), added_of(library, second)
+
+    # Перенос в другой каталог и переименование на месте меняют ctime файла
+    moved = os.path.join(root, 'Artist', 'Album', 'one.mp3')
+    os.makedirs(os.path.dirname(moved))
+    os.rename(first, moved)
+    renamed = os.path.join(root, 'Inbox', 'two (1).mp3')
+    os.rename(second, renamed)
+    assert os.stat(moved).st_ctime > added[0]
+    library.rescan(options)
+
+    assert library.paths() == sorted([moved, renamed])
+    assert (added_of(library, moved), added_of(library, renamed)) == added
+    library.close()
+
+
+def test_file_moved_under_watch_keeps_its_added_date(tmp_path, write_track):
+    root = str(tmp_path / 'music')
+    old = write_track(os.path.join(root, 'one.mp3'))
+    library = LibraryIndex(str(tmp_path / 'library.db'))
+    library.rescan(ScanOptions([root]))
+    added = added_of(library, old)
+
+    new = os.path.join(root, 'renamed.mp3')
+    os.rename(old, new)
+    # События слежения могут прийти отдельными пачками: сначала удаление, потом появление
+    assert library.update_paths([old]) == ([], [], [old])
+    assert library.update_paths([new]) == ([new], [], [])
+    assert added_of(library, new) == added
+    library.close()
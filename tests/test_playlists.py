@@ -0,0 +1,89 @@
+import json
+from playlists import PlaylistStore, FORMAT_VERSION
+
+
+def make_store(tmp_path):
+    # Отложенная запись не нужна: тесты сбрасывают журнал сами через flush()
+    store = PlaylistStore(str(tmp_path / 'playlists.json'), flush_delay=3600)
+    store.load()
+    return store
+
+
+def test_journal_survives_restart(tmp_path):
+    store = make_store(tmp_path)
+    store.create('a')
+    store.add_tracks('a', ['x', 'y'])
+    store.remove_track('a', 0)
+    store.flush()
+
+    assert make_store(tmp_path).playlists == {'a': ['y']}
+
+
+def test_torn_journal_tail_is_cut_before_next_append(tmp_path):
+    store = make_store(tmp_path)
+    store.create('a')
+    store.add_tracks('a', ['x', 'y'])
+    store.flush()
+    with open(store.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"op": "add", "name": "a", "tra')
+
+    store = make_store(tmp_path)
+    assert store.playlists == {'a': ['x', 'y']}
+    store.add_tracks('a', ['z'])
+    store.create('b')
+    store.add_tracks('b', ['w'])
+    store.flush()
+
+    assert make_store(tmp_path).playlists == {'a': ['x', 'y', 'z'], 'b': ['w']}
+
+
+def test_truncated_snapshot_keeps_complete_playlists(tmp_path):
+    path = tmp_path / 'playlists.json'
+    data = json.dumps({'version': FORMAT_VERSION, 'seq': 0,
+                       'playlists': {'a': ['x', 'y'], 'b': ['z', 'w']}}, ensure_ascii=False)
+    path.write_text(data[:data.index('"w"')], encoding='utf-8')
+
+    assert make_store(tmp_path).playlists == {'a': ['x', 'y']}
+
+
+def test_compaction_skips_already_applied_ops(tmp_path):
+    store = make_store(tmp_path)
+    store.create('a')
+    store.add_tracks('a', ['x'])
+    store.flush()
+    journal = open(store.journal_path, encoding='utf-8').read()
+    store.compact()
+    # Сбой между записью снимка и очисткой журнала: старые записи остались
+    with open(store.journal_path, 'w', encoding='utf-8') as f:
+        f.write(journal)
+
+    assert make_store(tmp_path).playlists == {'a': ['x']}
+
+
+def test_failed_flush_keeps_edits_for_the_next_one(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    store.create('a')
+    store.add_tracks('a', ['x'])
+
+    def broken_fsync(fd):
+        raise OSError(28, 'No space left on device')
+    with monkeypatch.context() as patch:
+        patch.setattr('os.fsync', broken_fsync)
+        store.flush()
+    assert store.pending and store.timer is not None
+    assert make_store(tmp_path).playlists == {}
+
+    store.flush()
+    assert make_store(tmp_path).playlists == {'a': ['x']}
+
+
+def test_ops_written_twice_apply_once(tmp_path):
+    store = make_store(tmp_path)
+    store.create('a')
+    store.add_tracks('a', ['x'])
+    store.flush()
+    journal = open(store.journal_path, encoding='utf-8').read()
+    with open(store.journal_path, 'a', encoding='utf-8') as f:
+        f.write(journal)
+
+    assert make_store(tmp_path).playlists == {'a': ['x']}
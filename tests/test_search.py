@@ -0,0 +1,25 @@
+from search import SearchIndex
+
+
+def test_retagged_track_does_not_duplicate_words():
+    index = SearchIndex()
+    for number in range(100):
+        index.add(f'{number}.mp3', f'Song {number}', f'Artist {number}', '')
+    index.search('so')
+    for number in range(200):
+        index.add('0.mp3', 'Night' if number % 2 else 'Day', 'Artist 0', '')
+        index.search('ni')
+
+    assert len(index.tokens) == len(set(index.tokens))
+    assert index.search('night') == {'0.mp3'}
+    assert index.search('day') == set()
+
+
+def test_prefix_search_intersects_words():
+    index = SearchIndex()
+    index.add('a.mp3', 'Ёлка', 'Café Tacvba', 'Re')
+    index.add('b.mp3', 'Елена', 'Cafe del Mar', '')
+
+    assert index.search('ел') == {'a.mp3', 'b.mp3'}
+    assert index.search('cafe ta') == {'a.mp3'}
+    assert index.search('   ') is None
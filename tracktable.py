@@ -0,0 +1,174 @@
+from array import array
+
+
+class StringPool:
+    """Интернированные строки одной колонки: каждая различная строка хранится один раз, в колонке — её номер.
+
+    refs считает живые треки с этой строкой, folded — строки без учёта регистра
+    для сортировки. Номер строки не меняется и не переиспользуется, поэтому его
+    можно держать в группировках и фильтрах.
+    """
+    __slots__ = ('strings', 'folded', 'ids', 'refs')
+
+    def __init__(self):
+        self.strings = []
+        self.folded = []
+        self.ids = {}
+        self.refs = array('I')
+
+    def __len__(self):
+        return len(self.strings)
+
+    def add(self, value):
+        number = self.ids.get(value)
+        if number is None:
+            number = self.ids[value] = len(self.strings)
+            self.strings.append(value)
+            self.folded.append((value or '').casefold())
+            self.refs.append(0)
+        self.refs[number] += 1
+        return number
+
+    def release(self, number):
+        self.refs[number] -= 1
+
+
+class TrackTable:
+    """Метаданные треков в памяти по колонкам, а не объектом на трек.
+
+    Строка таблицы — номер трека. Размер, mtime, длительность, битрейт и флаг
+    обложки лежат в array, идентификатор трека — 64-битным числом, исполнитель
+    и альбом — номерами в StringPool. Отдельными объектами остаются только путь
+    и название. Освободившиеся строки занимаются новыми треками, поэтому номер
+    строки действителен, пока трек в таблице.
+
+    Фильтры работают прямо по колонкам и возвращают номера строк, порядки
+    сортировки держит TrackViews; кортеж полей в порядке TRACK_COLUMNS
+    собирается только по запросу record().
+    Подписчикам из listeners (порядкам TrackViews, умным плейлистам)
+    сообщается о каждой строке: discard(row) до её изменения, insert(row) после.
+    Блокировок здесь нет — их держит владелец таблицы.
+    """
+
+    COLUMNS = ('path', 'size', 'mtime', 'title', 'artist', 'album', 'duration', 'bitrate', 'has_cover', 'track_id',
+               'added')
+    NUMERIC = {'size': 'q', 'mtime': 'd', 'duration': 'd', 'bitrate': 'i', 'has_cover': 'b', 'track_id': 'Q',
+               'added': 'd', 'artist': 'I', 'album': 'I'}
+
+    def __init__(self):
+        self.path = []
+        self.title = []
+        for column, code in self.NUMERIC.items():
+            setattr(self, column, array(code))
+        self.artists = StringPool()
+        self.albums = StringPool()
+        self.pools = {'artist': self.artists, 'album': self.albums}
+        self.arrays = [getattr(self, column) for column in self.NUMERIC]
+        self.rows = {}
+        self.by_id = {}
+        self.free = []
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, path):
+        return path in self.rows
+
+    def add(self, path, size, mtime, title, artist, album, duration, bitrate, has_cover, track_id, added=0):
+        """Добавляет трек или заменяет его поля, если путь уже в таблице; возвращает номер строки"""
+        row = self.rows.get(path)
+        if row is not None:
+            for listener in self.listeners:
+                listener.discard(row)
+            self._release(row)
+        elif self.free:
+            row = self.free.pop()
+        else:
+            row = len(self.path)
+            self.path.append(None)
+            self.title.append(None)
+            for values in self.arrays:
+                values.append(0)
+        number = int(track_id, 16)
+        self.path[row] = path
+        self.title[row] = title
+        self.size[row] = size
+        self.mtime[row] = mtime
+        self.artist[row] = self.artists.add(artist)
+        self.album[row] = self.albums.add(album)
+        self.duration[row] = duration or 0
+        self.bitrate[row] = bitrate or 0
+        self.has_cover[row] = bool(has_cover)
+        self.track_id[row] = number
+        self.added[row] = added or 0
+        self.rows[path] = row
+        self.by_id[number] = row
+        for listener in self.listeners:
+            listener.insert(row)
+        return row
+
+    def remove(self, path):
+        """Убирает трек из таблицы; возвращает номер освобождённой строки или None"""
+        row = self.rows.pop(path, None)
+        if row is None:
+            return None
+        for listener in self.listeners:
+            listener.discard(row)
+        self._release(row)
+        self.path[row] = None
+        self.title[row] = None
+        self.free.append(row)
+        return row
+
+    def _release(self, row):
+        self.artists.release(self.artist[row])
+        self.albums.release(self.album[row])
+        number = self.track_id[row]
+        if self.by_id.get(number) == row:
+            del self.by_id[number]
+
+    def row_of_id(self, track_id):
+        return self.by_id.get(int(track_id, 16))
+
+    def value(self, row, column):
+        """Значение колонки в строке; для исполнителя и альбома — сама строка, а не её номер"""
+        value = getattr(self, column)[row]
+        pool = self.pools.get(column)
+        return pool.strings[value] if pool is not None else value
+
+    def record(self, row):
+        """Поля трека в порядке TRACK_COLUMNS"""
+        return (self.path[row], self.size[row], self.mtime[row], self.title[row],
+                self.artists.strings[self.artist[row]], self.albums.strings[self.album[row]],
+                self.duration[row], self.bitrate[row], bool(self.has_cover[row]), f'{self.track_id[row]:016x}',
+                self.added[row])
+
+    def display_name(self, row):
+        return f'{self.title[row]} - {self.artists.strings[self.artist[row]]}'
+
+    def live_rows(self):
+        """Номера строк всех треков в порядке строк таблицы"""
+        return [row for row, path in enumerate(self.path) if path is not None]
+
+    def select(self, column, predicate, rows=None):
+        """Номера строк, значение колонки в которых удовлетворяет predicate.
+
+        Для исполнителя и альбома predicate вызывается один раз на различную
+        строку пула, а треки потом отбираются сравнением номеров.
+        """
+        values = getattr(self, column)
+        pool = self.pools.get(column)
+        if pool is not None:
+            test = {number for number, string in enumerate(pool.strings)
+                    if pool.refs[number] and predicate(string)}.__contains__
+        else:
+            test = predicate
+        path = self.path
+        if rows is None:
+            return [row for row, value in enumerate(values) if path[row] is not None and test(value)]
+        return [row for row in rows if test(values[row])]
+
+    def paths_of(self, rows):
+        path = self.path
+        return [path[row] for row in rows]
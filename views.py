@@ -0,0 +1,114 @@
+from array import array
+from bisect import bisect_left, insort
+
+SORT_ORDERS = ('title', 'artist', 'album', 'added', 'duration')
+
+
+class TrackViews:
+    """Готовые порядки сортировки и группировка исполнитель → альбом → треки поверх TrackTable.
+
+    Порядок — массив номеров строк таблицы, отсортированный по ключу, который
+    кончается путём, так что ключи не повторяются. Каждый порядок строится
+    один раз при первом запросе, а дальше таблица сообщает о каждом
+    добавленном, изменённом и убранном треке (insert и discard), и номер
+    строки встаёт на место бисекцией — без пересортировки и без чтения тегов.
+    Группы держат номера исполнителей и альбомов из пулов строк таблицы:
+    исполнители отсортированы всегда, альбомы одного исполнителя сортируются
+    при запросе, треки альбома идут по пути (обычно это и порядок номеров).
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.keys = {name: self._key(name) for name in SORT_ORDERS}
+        self.orders = {}
+        self.groups = None
+        self.artists = None
+        table.listeners.append(self)
+
+    def _key(self, name):
+        table = self.table
+        path, title, artist, album = table.path, table.title, table.artist, table.album
+        artists, albums = table.artists.folded, table.albums.folded
+        if name == 'title':
+            return lambda row: ((title[row] or '').casefold(), path[row])
+        if name == 'artist':
+            return lambda row: (artists[artist[row]], albums[album[row]], path[row])
+        if name == 'album':
+            return lambda row: (albums[album[row]], path[row])
+        values = getattr(table, name)
+        return lambda row: (values[row], path[row])
+
+    def invalidate(self):
+        """Забывает построенные порядки и группы; они построятся заново при следующем запросе"""
+        self.orders.clear()
+        self.groups = None
+        self.artists = None
+
+    def order(self, name):
+        """Номера строк в порядке name (не изменять)"""
+        order = self.orders.get(name)
+        if order is None:
+            order = self.orders[name] = array('I', sorted(self.table.live_rows(), key=self.keys[name]))
+        return order
+
+    def insert(self, row):
+        for name, order in self.orders.items():
+            insort(order, row, key=self.keys[name])
+        if self.groups is not None:
+            artist = self.table.artist[row]
+            albums = self.groups.get(artist)
+            if albums is None:
+                albums = self.groups[artist] = {}
+                insort(self.artists, artist, key=self.table.artists.folded.__getitem__)
+            insort(albums.setdefault(self.table.album[row], []), row, key=self.table.path.__getitem__)
+
+    def discard(self, row):
+        """Убирает строку из порядков и групп; вызывается, пока в строке ещё старые значения"""
+        for name, order in self.orders.items():
+            key = self.keys[name]
+            position = bisect_left(order, key(row), key=key)
+            if position < len(order) and order[position] == row:
+                del order[position]
+            else:
+                order.remove(row)
+        if self.groups is not None:
+            artist, album = self.table.artist[row], self.table.album[row]
+            albums = self.groups[artist]
+            rows = albums[album]
+            rows.remove(row)
+            if not rows:
+                del albums[album]
+                if not albums:
+                    del self.groups[artist]
+                    self.artists.remove(artist)
+
+    def _build_groups(self):
+        table = self.table
+        self.groups = {}
+        for row in sorted(table.live_rows(), key=table.path.__getitem__):
+            self.groups.setdefault(table.artist[row], {}).setdefault(table.album[row], []).append(row)
+        self.artists = sorted(self.groups, key=table.artists.folded.__getitem__)
+
+    def artist_ids(self):
+        """Номера исполнителей в алфавитном порядке (не изменять)"""
+        if self.groups is None:
+            self._build_groups()
+        return self.artists
+
+    def album_ids(self, artist):
+        """Номера альбомов исполнителя в алфавитном порядке"""
+        if self.groups is None:
+            self._build_groups()
+        return sorted(self.groups.get(artist, ()), key=self.table.albums.folded.__getitem__)
+
+    def album_rows(self, artist, album):
+        if self.groups is None:
+            self._build_groups()
+        return self.groups.get(artist, {}).get(album, [])
+
+    def artist_rows(self, artist):
+        """Треки исполнителя по альбомам"""
+        rows = []
+        for album in self.album_ids(artist):
+            rows.extend(self.groups[artist][album])
+        return rows
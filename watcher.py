@@ -0,0 +1,190 @@
+import os
+import sys
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import threading
+from formats import is_audio_name
+from library import normalize_path
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+FILE_EVENTS = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+DIR_EVENTS = IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+EVENT = struct.Struct('iIII')
+READ_BYTES = 64 * 1024
+SETTLE_DELAY = 0.5
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        _libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+    return _libc
+
+
+def available():
+    """Проверяет, есть ли inotify: только Linux и только если libc его экспортирует"""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        return hasattr(_load_libc(), 'inotify_init1')
+    except OSError:
+        return False
+
+
+class LibraryWatcher:
+    """Следит за каталогами медиатеки через inotify и точечно обновляет индекс.
+
+    События копятся, пока файловая система не успокоится на SETTLE_DELAY
+    секунд: копирование альбома даёт одну пачку, а не сотню. Изменённые
+    аудиофайлы передаются в library.update_paths() прямо из потока
+    наблюдателя, а колбэк on_changes(added, updated, removed) получает
+    только то, что действительно поменялось в индексе. Появление,
+    исчезновение и переименование каталогов, а также переполнение очереди
+    событий сообщаются через on_dirs_changed(): их проще отдать
+    инкрементальному сканированию. Оба колбэка вызываются из рабочего
+    потока.
+    """
+
+    def __init__(self, library, options, on_changes=None, on_dirs_changed=None):
+        self.library = library
+        self.options = options
+        self.on_changes = on_changes
+        self.on_dirs_changed = on_dirs_changed
+        self.fd = None
+        self.watches = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, dirs):
+        """Ставит наблюдение на каталоги dirs; возвращает False, если inotify недоступен или исчерпан лимит"""
+        if not available():
+            return False
+        self.fd = _load_libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            return False
+        try:
+            for path in dirs:
+                self._watch(path)
+        except OSError as e:
+            # Обычно это лимит fs.inotify.max_user_watches
+            print(f'Ошибка наблюдения за медиатекой: {e}')
+            os.close(self.fd)
+            self.fd = None
+            return False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def _watch(self, path):
+        wd = _load_libc().inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            # Каталог мог исчезнуть, пока до него дошла очередь
+            if code in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(code, os.strerror(code), path)
+        self.watches[wd] = path
+
+    def _watch_tree(self, path):
+        """Ставит наблюдение на новый каталог и его подкаталоги, соблюдая отсечения из настроек"""
+        depth = self.options.depth(path)
+        if depth is None or not self.options.allows(path, depth):
+            return
+        self._watch(path)
+        try:
+            with os.scandir(path) as entries:
+                subdirs = [normalize_path(entry.path) for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            return
+        for subdir in subdirs:
+            self._watch_tree(subdir)
+
+    def _run(self):
+        files = set()
+        dirs_changed = False
+        while not self._stop_event.is_set():
+            ready, _, _ = select.select([self.fd], [], [], SETTLE_DELAY)
+            if ready:
+                try:
+                    data = os.read(self.fd, READ_BYTES)
+                except BlockingIOError:
+                    continue
+                dirs_changed |= self._parse(data, files)
+                continue
+            # SETTLE_DELAY секунд без событий — применяем накопленное
+            if files:
+                paths, files = files, set()
+                try:
+                    changes = self.library.update_paths(paths)
+                except Exception as e:
+                    print(f'Ошибка обновления медиатеки: {e}')
+                    changes = ((), (), ())
+                if any(changes) and self.on_changes:
+                    self.on_changes(*changes)
+            if dirs_changed:
+                dirs_changed = False
+                if self.on_dirs_changed:
+                    self.on_dirs_changed()
+
+    def _parse(self, data, files):
+        """Разбирает пачку событий inotify; возвращает True, если изменилась структура каталогов"""
+        dirs_changed = False
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0'))
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                dirs_changed = True
+                continue
+            if mask & IN_IGNORED:
+                # Каталог удалён; переехавший каталог остаётся под тем же wd и получит новый путь в _watch_tree
+                self.watches.pop(wd, None)
+                continue
+            dir_path = self.watches.get(wd)
+            if dir_path is None or not name:
+                continue
+            path = dir_path.rstrip('/') + '/' + name
+            if mask & IN_ISDIR:
+                if mask & DIR_EVENTS:
+                    dirs_changed = True
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self._watch_tree(path)
+                        except OSError as e:
+                            print(f'Ошибка наблюдения за медиатекой: {e}')
+            elif mask & FILE_EVENTS and is_audio_name(name):
+                files.add(path)
+        return dirs_changed